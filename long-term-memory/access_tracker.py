@@ -0,0 +1,109 @@
+import atexit
+import threading
+from datetime import datetime
+
+
+class AccessTracker:
+    """
+    Write-behind buffer for memory access tracking
+
+    Retrievals only bump an in-memory counter; a background thread flushes
+    the aggregated increments every `flush_interval` seconds (or as soon as
+    `max_pending` distinct memories are buffered) in one bulk UPDATE.
+    Pending increments are flushed on close() and at interpreter exit.
+    """
+
+    def __init__(self, flush_fn, flush_interval: float = 5.0, max_pending: int = 100):
+        """
+        Args:
+            flush_fn: Callable taking {memory_id: (count, last_accessed)}
+            flush_interval: Seconds between periodic flushes
+            max_pending: Flush early once this many memories are buffered
+        """
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failures = 0
+
+        self._worker = threading.Thread(target=self._run, name="access-tracker", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def record(self, memory_id: int):
+        """Buffer one access of a memory"""
+        now = datetime.utcnow()
+        with self._lock:
+            count, _ = self._pending.get(memory_id, (0, None))
+            self._pending[memory_id] = (count + 1, now)
+            self.recorded += 1
+            full = len(self._pending) >= self.max_pending
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write all buffered increments now, returns the number of memories updated"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+
+            if not batch:
+                return 0
+
+            try:
+                self.flush_fn(batch)
+            except Exception as e:
+                print(f"⚠️  Access tracking flush failed: {e}")
+                self.failures += 1
+                self._requeue(batch)
+                return 0
+
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            return len(batch)
+
+    def _requeue(self, batch: dict):
+        """Merge a failed batch back so it is retried on the next flush"""
+        with self._lock:
+            for memory_id, (count, last_accessed) in batch.items():
+                pending_count, pending_last = self._pending.get(memory_id, (0, None))
+                if pending_last is not None:
+                    last_accessed = max(last_accessed, pending_last)
+                self._pending[memory_id] = (pending_count + count, last_accessed)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._worker.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        """Get buffer size and flush counters"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'recorded': self.recorded,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failures': self.failures,
+        }
@@ -0,0 +1,205 @@
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from datetime import datetime
+import config
+from database import (
+    LongTermMemory,
+    ShortTermMessage,
+    bulk_access_update_statement,
+    merge_update_statement,
+    relevance_row_to_dict,
+    relevance_search_statement,
+    search_settings_statements,
+)
+from engine_registry import get_async_engine
+from ltm_cache import ltm_index_cache
+from stm_buffer import stm_buffer
+
+
+class AsyncDatabaseManager:
+    """
+    Async counterpart of DatabaseManager for the per-turn pipeline
+
+    Covers the hot-path operations (STM add/get, LTM store/search, access
+    updates) on an asyncpg session pool, so a worker can serve many
+    conversations without a blocked thread per round trip. Schema creation
+    and maintenance stay on the sync DatabaseManager.
+    """
+
+    def __init__(self):
+        self.engine = get_async_engine(config.ASYNC_DATABASE_URL)
+        self.Session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    # ==================
+    # STM Operations
+    # ==================
+    async def add_stm_message(self, user_id, session_id, role, content):
+        async with self.Session() as session:
+            msg = ShortTermMessage(
+                user_id=user_id,
+                session_id=session_id,
+                role=role,
+                content=content,
+            )
+            session.add(msg)
+            await session.commit()
+
+            if stm_buffer:
+                stm_buffer.append(session_id, msg)
+
+    async def get_stm_messages(self, session_id, limit=None, before=None):
+        if stm_buffer:
+            # Served from the in-process ring buffer when it covers the request
+            if not stm_buffer.is_hydrated(session_id):
+                stm_buffer.hydrate(
+                    session_id, await self._load_stm_rows(session_id, stm_buffer.capacity)
+                )
+            rows = stm_buffer.get(session_id, limit, before)
+            if rows is not None:
+                return rows
+
+        async with self.Session() as session:
+            q = (
+                select(ShortTermMessage)
+                .where(ShortTermMessage.session_id == session_id)
+                .order_by(ShortTermMessage.timestamp.desc())
+            )
+            if before:
+                q = q.where(ShortTermMessage.timestamp < before)
+            if limit:
+                q = q.limit(limit)
+            result = await session.scalars(q)
+            return list(reversed(result.all()))
+
+    async def _load_stm_rows(self, session_id, limit):
+        """Latest rows of a session, newest first (ring buffer hydration)"""
+        async with self.Session() as session:
+            result = await session.scalars(
+                select(ShortTermMessage)
+                .where(ShortTermMessage.session_id == session_id)
+                .order_by(ShortTermMessage.timestamp.desc())
+                .limit(limit)
+            )
+            return result.all()
+
+    # ==================
+    # LTM Operations
+    # ==================
+    async def store_ltm(self, user_id, content, memory_type, importance, embedding):
+        async with self.Session() as session:
+            mem = LongTermMemory(
+                user_id=user_id,
+                content=content,
+                memory_type=memory_type,
+                importance=importance,
+                embedding=embedding.tolist(),
+            )
+            session.add(mem)
+            await session.commit()
+
+            if ltm_index_cache:
+                ltm_index_cache.add_memory(
+                    user_id,
+                    {
+                        "id": mem.id,
+                        "content": content,
+                        "memory_type": memory_type,
+                        "importance": importance,
+                        "created_at": mem.created_at,
+                        "access_count": 0,
+                    },
+                    embedding,
+                )
+
+            return mem.id
+
+    async def merge_ltm(self, memory_id, importance):
+        """Async DatabaseManager.merge_ltm"""
+        async with self.Session() as session:
+            result = await session.execute(merge_update_statement(memory_id, importance))
+            new_importance = result.scalar()
+            await session.commit()
+
+            if ltm_index_cache and new_importance is not None:
+                ltm_index_cache.update_memory(memory_id, importance=new_importance)
+
+            return new_importance
+
+    async def _apply_search_settings(self, session):
+        for statement in search_settings_statements():
+            await session.execute(text(statement))
+
+    async def search_ltm(self, user_id, query_embedding, top_k=5, min_similarity=0.7):
+        async with self.Session() as session:
+            await self._apply_search_settings(session)
+
+            distance = LongTermMemory.embedding.cosine_distance(query_embedding.tolist())
+            q = (
+                select(
+                    LongTermMemory.id,
+                    LongTermMemory.content,
+                    LongTermMemory.memory_type,
+                    LongTermMemory.importance,
+                    LongTermMemory.created_at,
+                    LongTermMemory.access_count,
+                    (1 - distance).label("similarity"),
+                )
+                .where(LongTermMemory.user_id == user_id)
+                .order_by(distance)
+                .limit(top_k)
+            )
+
+            results = []
+            for row in (await session.execute(q)).all():
+                if row.similarity >= min_similarity:
+                    results.append(
+                        {
+                            "id": row.id,
+                            "content": row.content,
+                            "memory_type": row.memory_type,
+                            "importance": row.importance,
+                            "similarity": float(row.similarity),
+                            "created_at": row.created_at,
+                            "access_count": row.access_count,
+                        }
+                    )
+            return results
+
+    async def search_ltm_by_relevance(self, user_id, query_embedding, top_k=5,
+                                      min_similarity=0.7, candidates=None):
+        """Async DatabaseManager.search_ltm_by_relevance (one SQL statement)"""
+        async with self.Session() as session:
+            await self._apply_search_settings(session)
+
+            statement = relevance_search_statement(
+                user_id, query_embedding, top_k, min_similarity, candidates
+            )
+            result = await session.execute(statement)
+            return [relevance_row_to_dict(row) for row in result.all()]
+
+    async def update_memory_access(self, memory_id):
+        async with self.Session() as session:
+            await session.execute(
+                update(LongTermMemory)
+                .where(LongTermMemory.id == memory_id)
+                .values(
+                    access_count=LongTermMemory.access_count + 1,
+                    last_accessed=datetime.utcnow(),
+                )
+            )
+            await session.commit()
+
+    async def bulk_update_memory_access(self, updates):
+        """Async DatabaseManager.bulk_update_memory_access"""
+        if not updates:
+            return
+
+        statement, params = bulk_access_update_statement(updates)
+
+        async with self.Session() as session:
+            await session.execute(statement, params)
+            await session.commit()
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self.engine.dispose()
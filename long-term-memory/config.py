@@ -26,27 +26,160 @@ DATABASE_URL = (
     f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
 
+# Async driver for the per-turn pipeline (async_database.py)
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
+    f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+
+# Connection pool (one shared sync + one async engine per process, see engine_registry.py)
+# DB_POOL_SIZE / DB_MAX_OVERFLOW cap the whole process and are split between the pools:
+#   async (per-turn pipeline):  DB_ASYNC_POOL_SIZE + its share of DB_MAX_OVERFLOW
+#   sync (extraction workers, access flush, LTM cache loads, maintenance): the rest
+# Defaults: async 4+3, sync 4+3. Each pool needs one connection, so DB_POOL_SIZE >= 2
+# (checked when the async engine is created).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))          # Persistent connections (both pools)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 6))    # Extra connections under burst load (both pools)
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", 4))  # Of DB_POOL_SIZE, for the async pipeline (1 .. DB_POOL_SIZE - 1)
+DB_POOL_TIMEOUT = 30        # Seconds to wait for a free connection
+DB_POOL_RECYCLE = 1800      # Recycle connections older than this (seconds)
+DB_POOL_PRE_PING = True     # Check connections are alive before use
+
 # =========================
 # Memory Configuration
 # =========================
 # Short-term memory (STM)
 STM_LIMIT = 10  # Keep last 10 messages in conversation
+STM_BUFFER_ENABLED = True       # Keep each session's last STM_LIMIT messages in process (write-through)
+STM_BUFFER_MAX_SESSIONS = 1000  # LRU bound on buffered sessions
 
 # Long-term memory (LTM)
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Free, fast, 384 dimensions
 EMBEDDING_DIM = 384
+EMBEDDING_BACKGROUND_WARMUP = True  # Load + warm up the model in a background thread at startup
+
+# Embedding inference backend
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" or "onnx" (CPU ONNX Runtime)
+EMBEDDING_ONNX_DIR = ".onnx_models"   # Exported ONNX models (created on first use)
+EMBEDDING_ONNX_QUANTIZE = True        # Use the dynamically quantized int8 model
+EMBEDDING_ONNX_THREADS = 0            # ONNX Runtime intra-op threads (0 = runtime default)
+EMBEDDING_ONNX_MIN_PARITY = 0.99      # Min cosine vs PyTorch vectors, else fall back to torch
+
+# Embedding cache (in-process LRU, keyed by content hash)
+EMBEDDING_CACHE_SIZE = 2048  # Max cached embeddings (0 = disabled)
+
+# Persistent embedding store (survives restarts, keyed by model + text hash)
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR")  # e.g. ".embedding_store" (None = disabled)
+
+# Micro-batching of concurrent single-text embedding requests
+EMBEDDING_BATCHING = False          # Enable for multi-user / concurrent workers
+EMBEDDING_BATCH_MAX_SIZE = 32       # Max texts per model.encode call
+EMBEDDING_BATCH_MAX_WAIT_MS = 5     # Max time to wait for more requests
+
+# Vector index on ltm_memories.embedding (cosine ops)
+# Searches always filter by user_id. Without iterative scans an ANN index
+# returns its global top candidates and filters afterwards, so a user can get
+# fewer than top_k rows - only enable one with pgvector >= 0.8 and
+# LTM_ITERATIVE_SCAN set. The exact default scans just the user's rows
+# (bounded by LTM_MAX_MEMORIES_PER_USER).
+LTM_VECTOR_INDEX = None          # "hnsw", "ivfflat" or None (exact per-user scan)
+LTM_HNSW_M = 16                  # HNSW build: max connections per node
+LTM_HNSW_EF_CONSTRUCTION = 64    # HNSW build: candidate list size
+LTM_IVFFLAT_LISTS = 100          # IVFFlat build: number of lists (~rows / 1000)
+LTM_HNSW_EF_SEARCH = 40          # HNSW query: candidate list size (recall vs speed)
+LTM_IVFFLAT_PROBES = 10          # IVFFlat query: lists to probe (recall vs speed)
+LTM_ITERATIVE_SCAN = None        # pgvector >= 0.8: "relaxed_order" keeps scanning the index
+                                 # until top_k rows pass the user_id filter
 
 # Semantic search
 MIN_SIMILARITY = 0.7  # Minimum similarity for memory retrieval
 TOP_K_MEMORIES = 5    # Retrieve top 5 most relevant memories
 
+# Batched similarity (EmbeddingManager.similarity_matrix / top_k_matrix)
+SIMILARITY_CHUNK_SIZE = 1024  # Rows per matmul block (bounds temporary memory)
+
+# Per-user in-process LTM index (answers top-k without a DB round trip)
+LTM_CACHE_ENABLED = True
+LTM_CACHE_MAX_USERS = 256                # LRU bound on cached users
+LTM_CACHE_TTL_SECONDS = 300              # Reload after this long (picks up other workers' writes)
+LTM_CACHE_MAX_MEMORIES_PER_USER = 5000   # Users above this always search in Postgres
+
+# Access tracking (write-behind: buffered, flushed as one bulk UPDATE)
+ACCESS_FLUSH_INTERVAL_SECONDS = 5.0  # Periodic flush
+ACCESS_FLUSH_MAX_PENDING = 100       # Flush early once this many memories are buffered
+
 # Relevance weighting (similarity vs importance)
 SIMILARITY_WEIGHT = 0.7  # 70% weight on semantic similarity
 IMPORTANCE_WEIGHT = 0.3  # 30% weight on memory importance
 
+# Search ranking
+LTM_SEARCH_MODE = "relevance"   # "relevance": threshold + weighted ranking in one SQL query
+                                # "similarity": top-k by similarity, re-ranked in Python
+LTM_RELEVANCE_CANDIDATES = None  # Rank only the N nearest memories (uses the ANN index);
+                                 # None = exact top-k by relevance over the user's memories
+
 # Memory extraction
 EXTRACT_EVERY_N_EXCHANGES = 1  # Extract after every exchange (1 = always)
+EXTRACTION_WINDOW_SIZE = 1     # >1: buffer N exchanges per session, extract them in one LLM call
+BACKGROUND_EXTRACTION = True   # Extract in a background worker (response returns immediately)
+EXTRACTION_WORKERS = 2         # Worker threads
+EXTRACTION_QUEUE_SIZE = 100    # Max queued exchanges (further jobs are dropped)
+EXTRACTION_MAX_RETRIES = 3     # Retries per job on LLM/DB errors
+EXTRACTION_RETRY_BACKOFF_SECONDS = 1.0  # Doubled on every retry
+EXTRACTION_DRAIN_TIMEOUT_SECONDS = 30   # Max wait for queued jobs on shutdown
+EXTRACTION_BATCH_CONCURRENCY = 4        # Concurrent LLM calls in batch_extract
+EXTRACTION_RATE_LIMIT_PER_SECOND = 2.0  # Sustained extraction LLM calls per second
+EXTRACTION_RATE_LIMIT_BURST = 4         # Calls allowed back-to-back before throttling
+
+# Extraction pre-filter (skips the LLM call for small talk)
+PREFILTER_ENABLED = True
+PREFILTER_SHADOW_MODE = True    # Send everything to the LLM, only count would-be skips/misses
+                                # (check the shadow miss rate in stats before turning it off)
+PREFILTER_MIN_SIMILARITY = 0.3  # Min cosine similarity to a "memorable" prototype statement
+PREFILTER_MIN_WORDS = 3         # Shorter messages need a first-person statement ("I", "my", ...)
+
+# Near-duplicate merge on store
+DEDUP_ENABLED = True
+DEDUP_SIMILARITY_THRESHOLD = 0.92  # Cosine similarity above which a new memory updates the nearest one
+DEDUP_IMPORTANCE_BOOST = 1         # Importance added to a memory each time it is repeated (max 10)
+
+# Memory consolidation (python consolidation.py, e.g. nightly)
+CONSOLIDATION_SIMILARITY_THRESHOLD = 0.8  # Memories this similar are merged into one
+CONSOLIDATION_MIN_MEMORIES = 20           # Skip users with fewer memories
+CONSOLIDATION_MAX_CLUSTER_SIZE = 10       # Max memories summarized in one LLM call
+CONSOLIDATION_MAX_USERS_PER_RUN = None    # None = every user with new memories
+
+# Capacity limit and retention (python database.py evict, or on insert)
+LTM_MAX_MEMORIES_PER_USER = 1000  # None = unlimited
+LTM_EVICTION_MODE = "archive"     # "archive": move to ltm_memories_archive, "delete": drop
+LTM_EVICTION_BATCH_SIZE = 500     # Memories evicted per transaction
+LTM_EVICT_ON_INSERT = True        # Trim a user as soon as new memories push them over the cap
+RETENTION_IMPORTANCE_WEIGHT = 0.5
+RETENTION_RECENCY_WEIGHT = 0.3
+RETENTION_ACCESS_WEIGHT = 0.2
+RETENTION_HALF_LIFE_DAYS = 30     # Recency score halves every N days without access
 
 # Emphasis thresholds
 HIGH_RELEVANCE_THRESHOLD = 0.85   # Highly relevant memories
 MEDIUM_RELEVANCE_THRESHOLD = 0.70  # Moderately relevant memories
+
+# Context window budget
+CONTEXT_TOKEN_BUDGET = 3000      # Max prompt tokens per turn (None = no budget, include everything)
+CONTEXT_LTM_MAX_SHARE = 0.5      # Max share of the remaining budget memories may use before STM
+TOKENIZER_ENCODING = "cl100k_base"  # tiktoken encoding used to count tokens
+TOKEN_COUNT_CACHE_SIZE = 4096    # Cached token counts (0 = disabled)
+MESSAGE_TOKEN_OVERHEAD = 4       # Tokens per chat message for role/separators
+
+# Context layout
+CONTEXT_LAYOUT = "prefix_cache"  # "prefix_cache": system prompt + history first, memories last (user role)
+                                 # (stable prompt prefix for provider caching)
+                                 # "classic": memories right after the system prompt
+CONTEXT_HISTORY_BLOCK = 6        # prefix_cache: drop the oldest STM messages this many at a time,
+                                 # so the history start (and the prompt prefix) only moves every
+                                 # few turns; history stays within STM_LIMIT - 1 messages
+                                 # (shrinking to STM_LIMIT - block right after a move)
+PREFIX_TRACKING_MAX_SESSIONS = 1000  # Sessions whose last context is kept for prefix stats
+
+# Context assembly memoization
+CONTEXT_CACHE_MAX_SESSIONS = 1000    # Sessions whose last formatted memory block is kept
+CONTEXT_MESSAGE_CACHE_SIZE = 10000   # LangChain messages kept per STM row id
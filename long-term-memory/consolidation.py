@@ -0,0 +1,170 @@
+import sys
+import numpy as np
+import config
+from database import DatabaseManager
+from embeddings import embedding_manager
+from memory_extractor import MemoryExtractor
+
+
+class MemoryConsolidator:
+    """
+    Offline job that merges overlapping memories per user
+
+    Each user's embeddings are clustered with one chunked similarity pass
+    (pairs above CONSOLIDATION_SIMILARITY_THRESHOLD), split into clusters
+    whose members are all pairwise similar; every cluster is summarized by
+    the LLM into one memory that replaces the originals in a single
+    transaction.
+
+    Progress is stored per user in ltm_consolidation_state, so a run can be
+    interrupted and restarted, and later runs only revisit users (and
+    clusters) that gained memories since their last consolidation.
+    """
+
+    def __init__(self, db: DatabaseManager = None, extractor: MemoryExtractor = None):
+        self.db = db or DatabaseManager()
+        self.extractor = extractor or MemoryExtractor()
+
+    def run(self, user_ids: list = None, max_users: int = None) -> dict:
+        """
+        Consolidate the given users, or every user with new memories
+
+        Returns:
+            dict with users processed, clusters merged, memories replaced
+        """
+        if user_ids:
+            candidates = [(user_id, 0) for user_id in user_ids]
+        else:
+            candidates = self.db.get_consolidation_candidates(
+                min_memories=config.CONSOLIDATION_MIN_MEMORIES,
+                limit=max_users or config.CONSOLIDATION_MAX_USERS_PER_RUN
+            )
+
+        totals = {'users': 0, 'clusters': 0, 'replaced': 0}
+        for user_id, last_memory_id in candidates:
+            result = self.consolidate_user(user_id, since_memory_id=last_memory_id)
+            totals['users'] += 1
+            totals['clusters'] += result['clusters']
+            totals['replaced'] += result['replaced']
+
+        return totals
+
+    def consolidate_user(self, user_id: str, since_memory_id: int = 0) -> dict:
+        """
+        Merge one user's overlapping memories
+
+        Args:
+            since_memory_id: Only merge clusters containing a memory newer
+                             than this id (everything older was already
+                             consolidated)
+
+        Returns:
+            dict with clusters merged and memories replaced
+        """
+        rows, embeddings = self.db.get_ltm_index_rows(user_id)
+        result = {'clusters': 0, 'replaced': 0}
+        if len(rows) < 2:
+            return result
+
+        print(f"🧹 Consolidating {len(rows)} memories for {user_id}...")
+        last_memory_id = max(row['id'] for row in rows)
+
+        for cluster in self._cluster(embeddings):
+            members = [rows[i] for i in cluster]
+            if all(m['id'] <= since_memory_id for m in members):
+                continue
+
+            summary = self.extractor.consolidate_memories(members)
+            if not summary:
+                continue
+
+            new_id = self.db.replace_ltm(
+                user_id=user_id,
+                memory_ids=[m['id'] for m in members],
+                content=summary['content'],
+                memory_type=summary['memory_type'],
+                importance=max(summary['importance'], max(m['importance'] for m in members)),
+                embedding=embedding_manager.generate_embedding(summary['content'])
+            )
+            if new_id is None:
+                continue  # Memories changed under us; picked up next run
+
+            last_memory_id = max(last_memory_id, new_id)
+            result['clusters'] += 1
+            result['replaced'] += len(members)
+            print(f"   ✅ {len(members)} memories → {summary['content'][:50]}...")
+
+        # Checkpoint: everything up to here (including new summaries) is consolidated
+        self.db.set_consolidation_state(user_id, last_memory_id)
+
+        return result
+
+    def _cluster(self, embeddings: np.ndarray) -> list:
+        """
+        Group memories into clusters of mutually similar embeddings
+
+        Connected components over the thresholded similarity graph narrow
+        the search; within a component, clusters are grown greedily from the
+        best-connected memory and a memory only joins if it is above
+        CONSOLIDATION_SIMILARITY_THRESHOLD with every member (complete link),
+        so a chain A~B~C never merges A and C. Clusters hold at most
+        CONSOLIDATION_MAX_CLUSTER_SIZE memories.
+
+        Returns:
+            List of clusters (lists of row indices), only clusters of 2+
+        """
+        threshold = config.CONSOLIDATION_SIMILARITY_THRESHOLD
+        pairs = embedding_manager.similar_pairs(embeddings, threshold)
+
+        # Union-find over the similar pairs
+        parent = np.arange(len(embeddings))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j, _ in pairs:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_j] = root_i
+
+        components = {}
+        for i in range(len(embeddings)):
+            components.setdefault(find(i), []).append(i)
+
+        clusters = []
+        for members in components.values():
+            if len(members) > 1:
+                clusters.extend(self._complete_link(embeddings, members, threshold))
+        return clusters
+
+    def _complete_link(self, embeddings: np.ndarray, members: list, threshold: float) -> list:
+        """Split one component into clusters whose members are all pairwise similar"""
+        similarity = embedding_manager.similarity_matrix(embeddings[members])
+        above = similarity >= threshold
+
+        # Best-connected memories seed clusters first
+        remaining = sorted(range(len(members)), key=lambda i: -int(above[i].sum()))
+        size = config.CONSOLIDATION_MAX_CLUSTER_SIZE
+        clusters = []
+        while remaining:
+            cluster = [remaining[0]]
+            for candidate in remaining[1:]:
+                if len(cluster) >= size:
+                    break
+                if above[candidate, cluster].all():
+                    cluster.append(candidate)
+
+            remaining = [i for i in remaining if i not in cluster]
+            if len(cluster) > 1:
+                clusters.append([members[i] for i in cluster])
+        return clusters
+
+if __name__ == "__main__":
+    # python consolidation.py               -> users with new memories
+    # python consolidation.py alice bob     -> specific users (full pass)
+    totals = MemoryConsolidator().run(user_ids=sys.argv[1:] or None)
+    print(f"✅ Consolidated {totals['users']} users: "
+          f"{totals['replaced']} memories merged into {totals['clusters']}")
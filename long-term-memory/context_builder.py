@@ -1,11 +1,37 @@
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from collections import OrderedDict
+import threading
 import config
+from token_counter import token_counter
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant with long-term memory of the user. Use the provided memories to personalize your responses."
+LTM_HEADER = "=== Relevant Information About the User ===\n\n"
+LTM_FOOTER = "\n=== Use this information to personalize your response ===\n"
+
+
+def _history_block() -> int:
+    return config.CONTEXT_HISTORY_BLOCK if config.CONTEXT_LAYOUT == "prefix_cache" else 1
 
 class ContextBuilder:
     """Build context window combining LTM, STM, and current query"""
     
+    def __init__(self):
+        self._previous_contexts = OrderedDict()  # session id -> last turn's message keys
+        self._history_starts = OrderedDict()     # session id -> STM row id the history starts at
+        self._prefix_lock = threading.Lock()
+        self.history_shifts = 0
+        
+        # Memoized context pieces (bounded LRUs)
+        self._ltm_blocks = OrderedDict()    # session id -> ((memory id, emphasis), ...), SystemMessage
+        self._stm_messages = OrderedDict()  # STM row id -> LangChain message
+        self._cache_lock = threading.Lock()
+        self.ltm_block_hits = 0
+        self.ltm_block_misses = 0
+        self.stm_message_hits = 0
+        self.stm_message_misses = 0
+    
     def build_context(self, ltm_memories: list, stm_messages: list, 
-                     system_prompt: str = None) -> list:
+                     system_prompt: str = None, session_id: str = None) -> list:
         """
         Assemble the complete context for LLM
         
@@ -13,31 +39,275 @@ class ContextBuilder:
             ltm_memories: Retrieved long-term memories
             stm_messages: Recent short-term messages
             system_prompt: Optional custom system prompt
+            session_id: Enables reuse of the session's formatted memory block
+                        and block-wise history truncation
             
         Returns:
             List of messages ready for LLM
         """
-        context = []
-        
         # 1. System prompt
         if not system_prompt:
-            system_prompt = "You are a helpful AI assistant with long-term memory of the user. Use the provided memories to personalize your responses."
-        
-        context.append(SystemMessage(content=system_prompt))
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
         # 2. Long-term memories (if any)
+        ltm_message = None
         if ltm_memories:
-            ltm_context = self._format_ltm_context(ltm_memories)
-            context.append(SystemMessage(content=ltm_context))
+            ltm_message = self._ltm_message(ltm_memories, session_id)
         
         # 3. Short-term messages
-        for msg in stm_messages:
+        history = self._to_messages(stm_messages)
+        start = self._history_start(session_id, stm_messages, len(history))
+        return self._layout(
+            SystemMessage(content=system_prompt),
+            ltm_message,
+            history[start:]
+        )
+    
+    def build_budgeted_context(self, ltm_memories: list, stm_messages: list,
+                               current_message: str, system_prompt: str = None,
+                               token_budget: int = None, session_id: str = None) -> tuple:
+        """
+        Assemble the context within a token budget
+        
+        Greedy packing in priority order: system prompt and current message
+        (always included), then memories by relevance (up to
+        CONTEXT_LTM_MAX_SHARE of the remaining budget), then the newest STM
+        messages. Whatever does not fit is dropped and reported; history is
+        dropped a block at a time (see _history_start).
+        
+        Args:
+            current_message: The user's message for this turn (appended last)
+            token_budget: Max prompt tokens (default CONTEXT_TOKEN_BUDGET)
+            session_id: Enables reuse of the session's formatted memory block
+                        and block-wise history truncation
+            
+        Returns:
+            (context messages, report dict with budget, used tokens, and the
+            dropped memory ids and number of dropped STM messages)
+        """
+        token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        system = SystemMessage(content=system_prompt or DEFAULT_SYSTEM_PROMPT)
+        current = HumanMessage(content=current_message)
+        
+        used = token_counter.count_message(system) + token_counter.count_message(current)
+        
+        # 1. Memories, most relevant first
+        ltm_budget = max(token_budget - used, 0) * config.CONTEXT_LTM_MAX_SHARE
+        ltm_used = token_counter.count(LTM_HEADER + LTM_FOOTER) + token_counter.message_overhead
+        kept_memories, dropped_memories = [], []
+        for memory in ltm_memories:
+            tokens = token_counter.count(self._format_memory_line(memory))
+            if ltm_used + tokens <= ltm_budget:
+                kept_memories.append(memory)
+                ltm_used += tokens
+            else:
+                dropped_memories.append(memory['id'])
+        if kept_memories:
+            used += ltm_used
+        
+        # 2. STM, newest first (a message that doesn't fit ends the history)
+        history = self._to_messages(stm_messages)
+        tokens = [token_counter.count_message(message) for message in history]
+        fits, history_used = 0, 0
+        for message_tokens in reversed(tokens):
+            if used + history_used + message_tokens > token_budget:
+                break
+            fits += 1
+            history_used += message_tokens
+        start = self._history_start(session_id, stm_messages, fits)
+        kept_history = history[start:]
+        used += sum(tokens[start:])
+        
+        ltm_message = None
+        if kept_memories:
+            ltm_message = self._ltm_message(kept_memories, session_id)
+        context = self._layout(system, ltm_message, kept_history)
+        context.append(current)
+        
+        report = {
+            'budget': token_budget,
+            'used_tokens': used,
+            'memories_included': len(kept_memories),
+            'dropped_memory_ids': dropped_memories,
+            'stm_included': len(kept_history),
+            'stm_dropped': len(history) - len(kept_history),
+        }
+        return context, report
+    
+    def _layout(self, system: SystemMessage, ltm_message, history: list) -> list:
+        """
+        Order the context according to CONTEXT_LAYOUT
+        
+        "prefix_cache": system prompt and history first, memories last (as a
+        user-role context message, since providers reject or reorder system
+        messages mid-conversation), so the start of the prompt is
+        byte-identical across turns and provider prompt caching can reuse it.
+        "classic": memories right after the system prompt.
+        """
+        if config.CONTEXT_LAYOUT == "prefix_cache":
+            context = [system] + history
+            if ltm_message:
+                context.append(ltm_message)
+            return context
+        
+        context = [system]
+        if ltm_message:
+            context.append(ltm_message)
+        return context + history
+    
+    def _history_start(self, session_id: str, stm_messages: list, fits: int) -> int:
+        """
+        Index of the first STM message to include
+        
+        With the prefix_cache layout the oldest history is dropped
+        CONTEXT_HISTORY_BLOCK messages at a time: the start stays pinned to
+        the same row while the history grows, and only moves when it would
+        exceed STM_LIMIT - 1 messages (or the `fits` newest that fit the token
+        budget). It then moves a block further than needed, so the history
+        shrinks below the cap and has room to grow again. Between moves, the
+        system prompt and history prefix are identical turn over turn.
+        
+        Args:
+            fits: How many of the newest messages fit
+        """
+        if session_id is None:
+            return len(stm_messages) - fits
+        
+        block = _history_block()
+        ids = [msg.id for msg in stm_messages]
+        limit = config.STM_LIMIT - 1  # the current message counts toward STM_LIMIT
+        cap = limit if fits >= len(ids) else min(limit, fits)
+        
+        with self._prefix_lock:
+            anchor = self._history_starts.get(session_id)
+            start = ids.index(anchor) if anchor is not None and anchor in ids else None
+            if start is None or len(ids) - start > cap:
+                if anchor is not None:
+                    self.history_shifts += 1
+                # Keep room for the next block - 1 messages before moving again
+                start = len(ids) - min(len(ids), max(cap - (block - 1), min(cap, 1)))
+            
+            if start < len(ids):
+                self._history_starts[session_id] = ids[start]
+                self._history_starts.move_to_end(session_id)
+                while len(self._history_starts) > config.PREFIX_TRACKING_MAX_SESSIONS:
+                    self._history_starts.popitem(last=False)
+            else:
+                self._history_starts.pop(session_id, None)
+        return start
+    
+    def measure_prefix_stability(self, session_id: str, context: list) -> dict:
+        """
+        Compare a turn's context with the previous turn of the same session
+        
+        In steady state with the prefix_cache layout, everything up to the
+        memory block is stable except on turns where the history start moves
+        (history_shifts).
+        
+        Returns:
+            dict with total tokens and stable_prefix_tokens: tokens in the
+            leading messages identical to last turn (what a provider-side
+            prompt cache can reuse)
+        """
+        keys = [(type(message).__name__, message.content) for message in context]
+        
+        with self._prefix_lock:
+            previous = self._previous_contexts.pop(session_id, [])
+            self._previous_contexts[session_id] = keys
+            while len(self._previous_contexts) > config.PREFIX_TRACKING_MAX_SESSIONS:
+                self._previous_contexts.popitem(last=False)
+        
+        stable_tokens = 0
+        for message, key, previous_key in zip(context, keys, previous):
+            if key != previous_key:
+                break
+            stable_tokens += token_counter.count_message(message)
+        
+        total_tokens = token_counter.count_messages(context)
+        return {
+            'total_tokens': total_tokens,
+            'stable_prefix_tokens': stable_tokens,
+            'stable_ratio': stable_tokens / total_tokens if total_tokens else 0.0,
+            'history_shifts': self.history_shifts,
+        }
+    
+    def _to_messages(self, stm_messages: list) -> list:
+        """Convert STM rows to LangChain messages (memoized by row id)"""
+        messages = []
+        misses = []
+        with self._cache_lock:
+            for msg in stm_messages:
+                message = self._stm_messages.get(msg.id) if msg.id is not None else None
+                if message is not None:
+                    self._stm_messages.move_to_end(msg.id)
+                    self.stm_message_hits += 1
+                else:
+                    misses.append(len(messages))
+                messages.append(message)
+        
+        if not misses:
+            return messages
+        
+        for i in misses:
+            msg = stm_messages[i]
             if msg.role == "user":
-                context.append(HumanMessage(content=msg.content))
+                messages[i] = HumanMessage(content=msg.content)
             else:
-                context.append(AIMessage(content=msg.content))
+                messages[i] = AIMessage(content=msg.content)
+        
+        with self._cache_lock:
+            self.stm_message_misses += len(misses)
+            for i in misses:
+                if stm_messages[i].id is not None:
+                    self._stm_messages[stm_messages[i].id] = messages[i]
+            while len(self._stm_messages) > config.CONTEXT_MESSAGE_CACHE_SIZE:
+                self._stm_messages.popitem(last=False)
+        return messages
+    
+    def _ltm_message(self, memories: list, session_id: str = None):
+        """
+        Memory block message, reused while a session retrieves the same set
+        
+        Keyed by the ordered (memory id, emphasis level) tuple, so it is only
+        re-formatted when the retrieved memories or their emphasis change.
+        """
+        key = tuple(
+            (memory['id'], self._get_emphasis_level(memory['relevance_score']))
+            for memory in memories
+        )
         
-        return context
+        if session_id is not None:
+            with self._cache_lock:
+                cached = self._ltm_blocks.get(session_id)
+                if cached is not None and cached[0] == key:
+                    self._ltm_blocks.move_to_end(session_id)
+                    self.ltm_block_hits += 1
+                    return cached[1]
+                self.ltm_block_misses += 1
+        
+        # Last in the prefix_cache layout: a user-role context message, not a
+        # mid-conversation system message
+        message_class = HumanMessage if config.CONTEXT_LAYOUT == "prefix_cache" else SystemMessage
+        message = message_class(content=self._format_ltm_context(memories))
+        
+        if session_id is not None:
+            with self._cache_lock:
+                self._ltm_blocks[session_id] = (key, message)
+                self._ltm_blocks.move_to_end(session_id)
+                while len(self._ltm_blocks) > config.CONTEXT_CACHE_MAX_SESSIONS:
+                    self._ltm_blocks.popitem(last=False)
+        return message
+    
+    def get_cache_stats(self) -> dict:
+        """Get memoization hit/miss counters for memory blocks and STM messages"""
+        with self._cache_lock:
+            return {
+                'ltm_block_hits': self.ltm_block_hits,
+                'ltm_block_misses': self.ltm_block_misses,
+                'stm_message_hits': self.stm_message_hits,
+                'stm_message_misses': self.stm_message_misses,
+                'stm_messages_cached': len(self._stm_messages),
+            }
     
     def _format_ltm_context(self, memories: list) -> str:
         """
@@ -45,27 +315,25 @@ class ContextBuilder:
         
         Memories are weighted by relevance score to guide LLM attention
         """
-        ltm_text = "=== Relevant Information About the User ===\n\n"
+        lines = [self._format_memory_line(memory) for memory in memories]
         
-        for memory in memories:
-            relevance = memory['relevance_score']
-            content = memory['content']
-            memory_type = memory['memory_type']
-            
-            # Determine emphasis level
-            emphasis = self._get_emphasis_level(relevance)
-            
-            # Format with emphasis
-            if emphasis == "high":
-                ltm_text += f"🔴 IMPORTANT [{memory_type}]: {content}\n"
-            elif emphasis == "medium":
-                ltm_text += f"🟡 Note [{memory_type}]: {content}\n"
-            else:
-                ltm_text += f"⚪ [{memory_type}]: {content}\n"
+        return LTM_HEADER + "".join(lines) + LTM_FOOTER
+    
+    def _format_memory_line(self, memory: dict) -> str:
+        """One memory line, prefixed according to its emphasis level"""
+        content = memory['content']
+        memory_type = memory['memory_type']
         
-        ltm_text += "\n=== Use this information to personalize your response ===\n"
+        # Determine emphasis level
+        emphasis = self._get_emphasis_level(memory['relevance_score'])
         
-        return ltm_text
+        # Format with emphasis
+        if emphasis == "high":
+            return f"🔴 IMPORTANT [{memory_type}]: {content}\n"
+        elif emphasis == "medium":
+            return f"🟡 Note [{memory_type}]: {content}\n"
+        else:
+            return f"⚪ [{memory_type}]: {content}\n"
     
     def _get_emphasis_level(self, relevance_score: float) -> str:
         """Determine emphasis level based on relevance score"""
@@ -83,9 +351,8 @@ class ContextBuilder:
         user_messages = sum(1 for msg in context if isinstance(msg, HumanMessage))
         assistant_messages = sum(1 for msg in context if isinstance(msg, AIMessage))
         
-        # Estimate token count (rough approximation: 1 token ≈ 4 characters)
-        total_chars = sum(len(msg.content) for msg in context)
-        estimated_tokens = total_chars // 4
+        # Token count from the local tokenizer (chars/4 estimate if unavailable)
+        estimated_tokens = token_counter.count_messages(context)
         
         return {
             'total_messages': total_messages,
@@ -1,18 +1,36 @@
 from sqlalchemy import (
-    create_engine,
     Column,
     Integer,
     String,
     Text,
     DateTime,
+    Float,
+    Index,
+    MetaData,
+    Table,
+    func,
+    select,
     text,
+    update,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from pgvector.sqlalchemy import Vector
 import numpy as np
+import os
+import sys
 import config
+from engine_registry import get_engine
+from ltm_cache import ltm_index_cache
+from stm_buffer import stm_buffer
+
+# The migration runner is shared with the short-term memory apps (repo root)
+_root = os.path.dirname(os.path.abspath(__file__))
+while not os.path.exists(os.path.join(_root, "schema_migrations.py")) and os.path.dirname(_root) != _root:
+    _root = os.path.dirname(_root)
+sys.path.insert(0, _root)
+import schema_migrations
 
 Base = declarative_base()
 
@@ -29,6 +47,11 @@ class ShortTermMessage(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # get_stm_messages: WHERE session_id = ? ORDER BY timestamp DESC LIMIT n
+        Index("ix_stm_messages_session_timestamp", "session_id", "timestamp"),
+    )
+
 
 # ======================
 # Long-term Memory (LTM)
@@ -46,21 +69,367 @@ class LongTermMemory(Base):
     last_accessed = Column(DateTime, default=datetime.utcnow)
     access_count = Column(Integer, default=0)
 
+    __table_args__ = (
+        # get_all_ltm: WHERE user_id = ? ORDER BY created_at DESC
+        Index("ix_ltm_memories_user_created", "user_id", "created_at"),
+    )
+
+
+class ArchivedMemory(Base):
+    """Memories evicted from ltm_memories by the capacity limit (LTM_EVICTION_MODE = "archive")"""
+    __tablename__ = "ltm_memories_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # original ltm_memories id
+    user_id = Column(String(100), nullable=False, index=True)
+    content = Column(Text, nullable=False)
+    memory_type = Column(String(50), nullable=False)
+    importance = Column(Integer, nullable=False)
+    embedding = Column(Vector(config.EMBEDDING_DIM))
+    created_at = Column(DateTime)
+    last_accessed = Column(DateTime)
+    access_count = Column(Integer)
+    retention_score = Column(Float)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ConsolidationState(Base):
+    """Per-user progress of the consolidation job (see consolidation.py)"""
+    __tablename__ = "ltm_consolidation_state"
+
+    user_id = Column(String(100), primary_key=True)
+    last_memory_id = Column(Integer, nullable=False, default=0)  # highest id already considered
+    consolidated_at = Column(DateTime, default=datetime.utcnow)
+
+
+def _build_vector_index():
+    """ANN index on ltm_memories.embedding, as configured by LTM_VECTOR_INDEX"""
+    if config.LTM_VECTOR_INDEX == "hnsw":
+        return Index(
+            "ix_ltm_memories_embedding_hnsw",
+            LongTermMemory.embedding,
+            postgresql_using="hnsw",
+            postgresql_with={
+                "m": config.LTM_HNSW_M,
+                "ef_construction": config.LTM_HNSW_EF_CONSTRUCTION,
+            },
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        )
+    if config.LTM_VECTOR_INDEX == "ivfflat":
+        return Index(
+            "ix_ltm_memories_embedding_ivfflat",
+            LongTermMemory.embedding,
+            postgresql_using="ivfflat",
+            postgresql_with={"lists": config.LTM_IVFFLAT_LISTS},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        )
+    if config.LTM_VECTOR_INDEX:
+        raise ValueError(f"Unknown LTM_VECTOR_INDEX: {config.LTM_VECTOR_INDEX}")
+    return None
+
+
+ltm_vector_index = _build_vector_index()
+
+
+# ======================
+# Schema Migrations
+# ======================
+# The runtime path only checks the schema version; DDL runs from the
+# explicit migrate command:  python database.py migrate
+SCHEMA_COMPONENT = "long_term_memory"
+
+
+def _create_baseline(conn):
+    """Version 1 schema as originally shipped (pinned, so later models don't leak in)"""
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
+    metadata = MetaData()
+    Table(
+        "stm_messages", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", String(100), nullable=False, index=True),
+        Column("session_id", String(100), nullable=False, index=True),
+        Column("role", String(20), nullable=False),
+        Column("content", Text, nullable=False),
+        Column("timestamp", DateTime),
+    )
+    Table(
+        "ltm_memories", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", String(100), nullable=False, index=True),
+        Column("content", Text, nullable=False),
+        Column("memory_type", String(50), nullable=False),
+        Column("importance", Integer, nullable=False),
+        Column("embedding", Vector(config.EMBEDDING_DIM)),
+        Column("created_at", DateTime),
+        Column("last_accessed", DateTime),
+        Column("access_count", Integer),
+    )
+    metadata.create_all(conn)  # checkfirst: databases created before migrations keep their tables
+
+
+def _create_composite_indexes(conn):
+    for table in (ShortTermMessage.__table__, LongTermMemory.__table__):
+        for index in table.indexes:
+            if index is not ltm_vector_index:
+                index.create(conn, checkfirst=True)
+
+
+VECTOR_INDEX_NAMES = ("ix_ltm_memories_embedding_hnsw", "ix_ltm_memories_embedding_ivfflat")
+
+
+def _create_vector_index(conn):
+    if ltm_vector_index is not None:
+        ltm_vector_index.create(conn, checkfirst=True)
+
+
+def _drop_unconfigured_vector_indexes(conn):
+    """Drop ANN indexes no longer configured, so the planner stops using them"""
+    for name in VECTOR_INDEX_NAMES:
+        if ltm_vector_index is None or ltm_vector_index.name != name:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _create_consolidation_state(conn):
+    ConsolidationState.__table__.create(conn, checkfirst=True)
+
+
+def _create_archive(conn):
+    ArchivedMemory.__table__.create(conn, checkfirst=True)
+
+
+# (version, description, function) - append only, never edit applied entries
+MIGRATIONS = [
+    (1, "pgvector extension, stm_messages and ltm_memories tables", _create_baseline),
+    (2, "composite indexes for STM reads and LTM listing", _create_composite_indexes),
+    (3, "ANN index on ltm_memories.embedding", _create_vector_index),
+    (4, "ltm_consolidation_state table", _create_consolidation_state),
+    (5, "ltm_memories_archive table", _create_archive),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn) -> int:
+    """Applied schema version for this component (0 if never migrated)"""
+    return schema_migrations.get_schema_version(conn, SCHEMA_COMPONENT)
+
+
+def _after_migrate(conn):
+    if ltm_vector_index is not None and not config.LTM_ITERATIVE_SCAN:
+        print("⚠️  LTM_VECTOR_INDEX without LTM_ITERATIVE_SCAN: per-user searches can "
+              "return fewer than top_k memories (needs pgvector >= 0.8)")
+    _drop_unconfigured_vector_indexes(conn)
+    _create_vector_index(conn)
+
+
+def migrate(engine=None) -> int:
+    """
+    Apply pending migrations (see schema_migrations.migrate)
+
+    Also (re)creates the configured ANN index and drops the other one, so
+    changing LTM_VECTOR_INDEX and re-running migrate rolls the change out.
+
+    Returns:
+        The schema version after migrating
+    """
+    return schema_migrations.migrate(
+        engine or get_engine(config.DATABASE_URL), SCHEMA_COMPONENT, MIGRATIONS,
+        after=_after_migrate
+    )
+
+
+def check_schema(engine):
+    """Fail fast if the database has not been migrated (one query per engine per process)"""
+    schema_migrations.check_schema(engine, SCHEMA_COMPONENT, SCHEMA_VERSION)
+
+
+# ======================
+# Shared Statements (used by DatabaseManager and AsyncDatabaseManager)
+# ======================
+def search_settings_statements() -> list:
+    """SET LOCAL statements for the configured ANN index's per-query parameters"""
+    if config.LTM_VECTOR_INDEX == "hnsw":
+        statements = [f"SET LOCAL hnsw.ef_search = {int(config.LTM_HNSW_EF_SEARCH)}"]
+    elif config.LTM_VECTOR_INDEX == "ivfflat":
+        statements = [f"SET LOCAL ivfflat.probes = {int(config.LTM_IVFFLAT_PROBES)}"]
+    else:
+        return []
+
+    if config.LTM_ITERATIVE_SCAN in ("strict_order", "relaxed_order"):
+        statements.append(
+            f"SET LOCAL {config.LTM_VECTOR_INDEX}.iterative_scan = {config.LTM_ITERATIVE_SCAN}"
+        )
+    return statements
+
+
+def relevance_search_statement(user_id, query_embedding, top_k, min_similarity, candidates=None):
+    """SELECT for search_ltm_by_relevance (see its docstring)"""
+    distance = LongTermMemory.embedding.cosine_distance(
+        query_embedding.tolist()
+    ).label("distance")
+
+    inner = select(
+        LongTermMemory.id,
+        LongTermMemory.content,
+        LongTermMemory.memory_type,
+        LongTermMemory.importance,
+        LongTermMemory.created_at,
+        LongTermMemory.access_count,
+        distance,
+    ).where(LongTermMemory.user_id == user_id)
+    if candidates:
+        inner = inner.order_by(distance).limit(candidates)
+
+    ranked = inner.cte("ltm_candidates").prefix_with("MATERIALIZED")
+
+    similarity = (1 - ranked.c.distance).label("similarity")
+    relevance = (
+        (1 - ranked.c.distance) * config.SIMILARITY_WEIGHT
+        + ranked.c.importance / 10.0 * config.IMPORTANCE_WEIGHT
+    ).label("relevance_score")
+
+    return (
+        select(
+            ranked.c.id,
+            ranked.c.content,
+            ranked.c.memory_type,
+            ranked.c.importance,
+            ranked.c.created_at,
+            ranked.c.access_count,
+            similarity,
+            relevance,
+        )
+        .where(ranked.c.distance <= 1 - min_similarity)
+        .order_by(relevance.desc())
+        .limit(top_k)
+    )
+
+
+def relevance_row_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "content": row.content,
+        "memory_type": row.memory_type,
+        "importance": row.importance,
+        "similarity": float(row.similarity),
+        "relevance_score": float(row.relevance_score),
+        "created_at": row.created_at,
+        "access_count": row.access_count,
+    }
+
+
+def bulk_access_update_statement(updates) -> tuple:
+    """
+    UPDATE ... FROM (VALUES ...) applying {memory_id: (count, last_accessed)}
+
+    Returns:
+        (statement, params)
+    """
+    values = []
+    params = {}
+    for i, (memory_id, (count, last_accessed)) in enumerate(updates.items()):
+        values.append(
+            f"(CAST(:id{i} AS INTEGER), CAST(:count{i} AS INTEGER), "
+            f"CAST(:ts{i} AS TIMESTAMP))"
+        )
+        params[f"id{i}"] = memory_id
+        params[f"count{i}"] = count
+        params[f"ts{i}"] = last_accessed
+
+    statement = text(
+        "UPDATE ltm_memories AS m "
+        "SET access_count = COALESCE(m.access_count, 0) + v.count, "
+        "last_accessed = GREATEST(m.last_accessed, v.ts) "
+        f"FROM (VALUES {', '.join(values)}) AS v(id, count, ts) "
+        "WHERE m.id = v.id"
+    )
+    return statement, params
+
+
+def merge_update_statement(memory_id, importance):
+    """
+    UPDATE reinforcing an existing memory with a near-duplicate
+
+    Keeps the higher importance plus DEDUP_IMPORTANCE_BOOST (capped at 10)
+    and refreshes last_accessed; returns the new importance.
+    """
+    return (
+        update(LongTermMemory)
+        .where(LongTermMemory.id == memory_id)
+        .values(
+            importance=func.least(
+                10,
+                func.greatest(LongTermMemory.importance, importance)
+                + config.DEDUP_IMPORTANCE_BOOST,
+            ),
+            last_accessed=datetime.utcnow(),
+        )
+        .returning(LongTermMemory.importance)
+    )
+
+
+def retention_score_sql() -> str:
+    """
+    SQL expression scoring how much a memory is worth keeping (0-1)
+
+    retention = importance/10 * RETENTION_IMPORTANCE_WEIGHT
+              + 0.5^(days since last use / RETENTION_HALF_LIFE_DAYS) * RETENTION_RECENCY_WEIGHT
+              + (1 - 1/(1 + access_count)) * RETENTION_ACCESS_WEIGHT
+    """
+    return (
+        f"(importance / 10.0 * {float(config.RETENTION_IMPORTANCE_WEIGHT)} "
+        f"+ POWER(0.5, EXTRACT(EPOCH FROM (now() AT TIME ZONE 'utc' "
+        f"- COALESCE(last_accessed, created_at))) / 86400.0 "
+        f"/ {float(config.RETENTION_HALF_LIFE_DAYS)}) * {float(config.RETENTION_RECENCY_WEIGHT)} "
+        f"+ (1 - 1.0 / (1 + COALESCE(access_count, 0))) * {float(config.RETENTION_ACCESS_WEIGHT)})"
+    )
+
+
+def eviction_statement(user_id=None, archive=True):
+    """
+    DELETE (and optionally archive) one batch of the lowest-retention
+    memories of users above LTM_MAX_MEMORIES_PER_USER
+
+    Params: cap, batch_size (and user_id when scoped to one user).
+    Returns the evicted (id, user_id) rows.
+    """
+    score = retention_score_sql()
+    scope = "WHERE user_id = :user_id " if user_id is not None else ""
+
+    evict = (
+        "WITH scored AS ("
+        f"SELECT id, {score} AS retention_score, "
+        f"ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY {score} DESC, id DESC) AS keep_rank "
+        f"FROM ltm_memories {scope}"
+        "), victims AS ("
+        "SELECT id, retention_score FROM scored WHERE keep_rank > :cap "
+        "ORDER BY retention_score LIMIT :batch_size"
+        "), evicted AS ("
+        "DELETE FROM ltm_memories m USING victims v WHERE m.id = v.id "
+        "RETURNING m.id, m.user_id, m.content, m.memory_type, m.importance, m.embedding, "
+        "m.created_at, m.last_accessed, m.access_count, v.retention_score"
+        ") "
+    )
+    if archive:
+        evict += (
+            "INSERT INTO ltm_memories_archive (id, user_id, content, memory_type, importance, "
+            "embedding, created_at, last_accessed, access_count, retention_score, archived_at) "
+            "SELECT id, user_id, content, memory_type, importance, embedding, created_at, "
+            "last_accessed, access_count, retention_score, now() AT TIME ZONE 'utc' FROM evicted "
+            "RETURNING id, user_id"
+        )
+    else:
+        evict += "SELECT id, user_id FROM evicted"
+
+    return text(evict)
+
 
 # ======================
 # Database Manager
 # ======================
 class DatabaseManager:
     def __init__(self):
-        self.engine = create_engine(config.DATABASE_URL)
-
-        # ✅ IMPORTANT: enable pgvector BEFORE creating tables
-        with self.engine.connect() as conn:
-            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-            conn.commit()
-
-        # ✅ Now safe to create tables using VECTOR
-        Base.metadata.create_all(self.engine)
+        # Shared, pooled engine: every DatabaseManager in the process reuses it
+        self.engine = get_engine(config.DATABASE_URL)
+        check_schema(self.engine)
 
         self.Session = sessionmaker(bind=self.engine)
 
@@ -77,11 +446,24 @@ class DatabaseManager:
                 content=content,
             )
             session.add(msg)
+            session.flush()
+            session.expunge(msg)  # Keep id/timestamp loaded past commit, no re-SELECT
             session.commit()
+
+            if stm_buffer:
+                stm_buffer.append(session_id, msg)
         finally:
             session.close()
 
-    def get_stm_messages(self, session_id, limit=None):
+    def get_stm_messages(self, session_id, limit=None, before=None):
+        if stm_buffer:
+            # Served from the in-process ring buffer when it covers the request
+            if not stm_buffer.is_hydrated(session_id):
+                stm_buffer.hydrate(session_id, self._load_stm_rows(session_id, stm_buffer.capacity))
+            rows = stm_buffer.get(session_id, limit, before)
+            if rows is not None:
+                return rows
+
         session = self.Session()
         try:
             q = (
@@ -89,12 +471,28 @@ class DatabaseManager:
                 .filter(ShortTermMessage.session_id == session_id)
                 .order_by(ShortTermMessage.timestamp.desc())
             )
+            if before:
+                q = q.filter(ShortTermMessage.timestamp < before)
             if limit:
                 q = q.limit(limit)
             return list(reversed(q.all()))
         finally:
             session.close()
 
+    def _load_stm_rows(self, session_id, limit):
+        """Latest rows of a session, newest first (ring buffer hydration)"""
+        session = self.Session()
+        try:
+            return (
+                session.query(ShortTermMessage)
+                .filter(ShortTermMessage.session_id == session_id)
+                .order_by(ShortTermMessage.timestamp.desc())
+                .limit(limit)
+                .all()
+            )
+        finally:
+            session.close()
+
     # ==================
     # LTM Operations
     # ==================
@@ -110,13 +508,56 @@ class DatabaseManager:
             )
             session.add(mem)
             session.commit()
+
+            if ltm_index_cache:
+                ltm_index_cache.add_memory(
+                    user_id,
+                    {
+                        "id": mem.id,
+                        "content": content,
+                        "memory_type": memory_type,
+                        "importance": importance,
+                        "created_at": mem.created_at,
+                        "access_count": 0,
+                    },
+                    embedding,
+                )
+
             return mem.id
         finally:
             session.close()
 
+    def merge_ltm(self, memory_id, importance):
+        """
+        Merge a near-duplicate into an existing memory instead of inserting it
+
+        Returns:
+            New importance of the memory, or None if it no longer exists
+        """
+        session = self.Session()
+        try:
+            new_importance = session.execute(
+                merge_update_statement(memory_id, importance)
+            ).scalar()
+            session.commit()
+
+            if ltm_index_cache and new_importance is not None:
+                ltm_index_cache.update_memory(memory_id, importance=new_importance)
+
+            return new_importance
+        finally:
+            session.close()
+
+    def _apply_search_settings(self, session):
+        """Set per-query ANN search parameters (scoped to the current transaction)"""
+        for statement in search_settings_statements():
+            session.execute(text(statement))
+
     def search_ltm(self, user_id, query_embedding, top_k=5, min_similarity=0.7):
         session = self.Session()
         try:
+            self._apply_search_settings(session)
+
             similarity_expr = (
                 1 - LongTermMemory.embedding.cosine_distance(query_embedding.tolist())
             ).label("similarity")
@@ -146,6 +587,78 @@ class DatabaseManager:
         finally:
             session.close()
 
+    def search_ltm_by_relevance(self, user_id, query_embedding, top_k=5, min_similarity=0.7,
+                                candidates=None):
+        """
+        Search LTM ranked by relevance, thresholded and ordered in one SQL statement
+
+        relevance = similarity * SIMILARITY_WEIGHT + importance/10 * IMPORTANCE_WEIGHT
+
+        The cosine distance is computed once per row (materialized CTE) and
+        only the returned columns are projected (no embedding transfer).
+
+        Args:
+            candidates: If set, rank only the N nearest memories (lets the ANN
+                        index serve the scan); None ranks every memory above
+                        min_similarity (exact top-k by relevance)
+        """
+        session = self.Session()
+        try:
+            self._apply_search_settings(session)
+
+            statement = relevance_search_statement(
+                user_id, query_embedding, top_k, min_similarity, candidates
+            )
+            return [relevance_row_to_dict(row) for row in session.execute(statement).all()]
+        finally:
+            session.close()
+
+    def get_ltm_index_rows(self, user_id, limit=None):
+        """
+        Load a user's memories for the in-process index (ltm_cache)
+
+        Returns:
+            (rows, embeddings): search_ltm-style dicts and an (n, dim) array
+        """
+        session = self.Session()
+        try:
+            q = (
+                session.query(
+                    LongTermMemory.id,
+                    LongTermMemory.content,
+                    LongTermMemory.memory_type,
+                    LongTermMemory.importance,
+                    LongTermMemory.created_at,
+                    LongTermMemory.access_count,
+                    LongTermMemory.embedding,
+                )
+                .filter(LongTermMemory.user_id == user_id)
+                .order_by(LongTermMemory.id)
+            )
+            if limit:
+                q = q.limit(limit)
+
+            rows = []
+            embeddings = []
+            for row in q.all():
+                rows.append(
+                    {
+                        "id": row.id,
+                        "content": row.content,
+                        "memory_type": row.memory_type,
+                        "importance": row.importance,
+                        "created_at": row.created_at,
+                        "access_count": row.access_count,
+                    }
+                )
+                embeddings.append(row.embedding)
+
+            if embeddings:
+                return rows, np.array(embeddings, dtype=np.float32)
+            return rows, np.empty((0, config.EMBEDDING_DIM), dtype=np.float32)
+        finally:
+            session.close()
+
     def update_memory_access(self, memory_id):
         session = self.Session()
         try:
@@ -157,6 +670,162 @@ class DatabaseManager:
         finally:
             session.close()
 
+    def bulk_update_memory_access(self, updates):
+        """
+        Apply buffered access increments in a single UPDATE ... FROM (VALUES ...)
+
+        Args:
+            updates: {memory_id: (count, last_accessed)}
+        """
+        if not updates:
+            return
+
+        statement, params = bulk_access_update_statement(updates)
+
+        session = self.Session()
+        try:
+            session.execute(statement, params)
+            session.commit()
+        finally:
+            session.close()
+
+    def replace_ltm(self, user_id, memory_ids, content, memory_type, importance, embedding):
+        """
+        Atomically replace several memories with one consolidated memory
+
+        The new memory inherits the earliest created_at, latest last_accessed
+        and summed access_count of the originals.
+
+        Returns:
+            id of the new memory, or None (nothing changed) if any of the
+            originals no longer exists
+        """
+        session = self.Session()
+        try:
+            originals = (
+                session.query(LongTermMemory)
+                .filter(LongTermMemory.user_id == user_id, LongTermMemory.id.in_(memory_ids))
+                .with_for_update()
+                .all()
+            )
+            if len(originals) != len(set(memory_ids)):
+                session.rollback()
+                return None
+
+            mem = LongTermMemory(
+                user_id=user_id,
+                content=content,
+                memory_type=memory_type,
+                importance=importance,
+                embedding=embedding.tolist(),
+                created_at=min(m.created_at for m in originals),
+                last_accessed=max(m.last_accessed or m.created_at for m in originals),
+                access_count=sum(m.access_count or 0 for m in originals),
+            )
+            for original in originals:
+                session.delete(original)
+            session.add(mem)
+            session.commit()
+
+            if ltm_index_cache:
+                ltm_index_cache.invalidate_user(user_id)
+
+            return mem.id
+        finally:
+            session.close()
+
+    def get_consolidation_candidates(self, min_memories, limit=None):
+        """
+        Users with at least min_memories memories and new memories since
+        their last consolidation run, oldest progress first
+
+        Returns:
+            List of (user_id, last_memory_id) tuples
+        """
+        session = self.Session()
+        try:
+            result = session.execute(
+                text(
+                    "SELECT m.user_id, COALESCE(s.last_memory_id, 0) AS last_memory_id "
+                    "FROM ltm_memories m "
+                    "LEFT JOIN ltm_consolidation_state s ON s.user_id = m.user_id "
+                    "GROUP BY m.user_id, s.last_memory_id, s.consolidated_at "
+                    "HAVING COUNT(*) >= :min_memories "
+                    "AND MAX(m.id) > COALESCE(s.last_memory_id, 0) "
+                    "ORDER BY s.consolidated_at NULLS FIRST, m.user_id "
+                    "LIMIT :limit"
+                ),
+                {"min_memories": min_memories, "limit": limit},
+            )
+            return [(row.user_id, row.last_memory_id) for row in result]
+        finally:
+            session.close()
+
+    def set_consolidation_state(self, user_id, last_memory_id):
+        """Record that a user's memories up to last_memory_id have been consolidated"""
+        session = self.Session()
+        try:
+            session.merge(ConsolidationState(
+                user_id=user_id,
+                last_memory_id=last_memory_id,
+                consolidated_at=datetime.utcnow(),
+            ))
+            session.commit()
+        finally:
+            session.close()
+
+    def count_ltm(self, user_id):
+        session = self.Session()
+        try:
+            return (
+                session.query(func.count(LongTermMemory.id))
+                .filter(LongTermMemory.user_id == user_id)
+                .scalar()
+            )
+        finally:
+            session.close()
+
+    def evict_ltm(self, user_id=None, cap=None, batch_size=None):
+        """
+        Trim users above the per-user capacity, lowest retention score first
+
+        Runs in batches (one transaction each) until every user is at or
+        below the cap. Evicted memories are archived or deleted depending on
+        LTM_EVICTION_MODE.
+
+        Args:
+            user_id: Only this user (default: every user over the cap)
+
+        Returns:
+            Number of memories evicted
+        """
+        cap = cap or config.LTM_MAX_MEMORIES_PER_USER
+        batch_size = batch_size or config.LTM_EVICTION_BATCH_SIZE
+        if not cap:
+            return 0
+
+        statement = eviction_statement(user_id, archive=config.LTM_EVICTION_MODE == "archive")
+        params = {"cap": cap, "batch_size": batch_size}
+        if user_id is not None:
+            params["user_id"] = user_id
+
+        total = 0
+        while True:
+            session = self.Session()
+            try:
+                evicted = session.execute(statement, params).all()
+                session.commit()
+            finally:
+                session.close()
+
+            if ltm_index_cache:
+                for row in evicted:
+                    ltm_index_cache.remove_memory(row.id)
+
+            total += len(evicted)
+            if len(evicted) < batch_size:
+                return total
+
     def get_all_ltm(self, user_id):
         session = self.Session()
         try:
@@ -176,6 +845,9 @@ class DatabaseManager:
                 LongTermMemory.id == memory_id
             ).delete()
             session.commit()
+
+            if ltm_index_cache:
+                ltm_index_cache.remove_memory(memory_id)
         finally:
             session.close()
 
@@ -188,6 +860,29 @@ class DatabaseManager:
             session.query(LongTermMemory).filter(
                 LongTermMemory.user_id == user_id
             ).delete()
+            session.query(ConsolidationState).filter(
+                ConsolidationState.user_id == user_id
+            ).delete()
+            session.query(ArchivedMemory).filter(
+                ArchivedMemory.user_id == user_id
+            ).delete()
             session.commit()
+
+            if ltm_index_cache:
+                ltm_index_cache.invalidate_user(user_id)
+            if stm_buffer:
+                stm_buffer.invalidate_user(user_id)
         finally:
             session.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    elif sys.argv[1:2] == ["evict"]:
+        # python database.py evict [user_id]
+        user_id = sys.argv[2] if len(sys.argv) > 2 else None
+        evicted = DatabaseManager().evict_ltm(user_id=user_id)
+        print(f"✅ Evicted {evicted} memories over the {config.LTM_MAX_MEMORIES_PER_USER} per-user limit")
+    else:
+        print("Usage: python database.py migrate | evict [user_id]")
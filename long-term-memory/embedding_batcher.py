@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching dispatcher for single-text embedding requests
+
+    Concurrent callers submit one text each; a worker thread collects
+    requests for up to `max_wait_ms` (or until `max_batch_size` is reached)
+    and runs them through a single batched encode call.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            encode_fn: Callable taking a list of texts, returning an (n, dim) array
+            max_batch_size: Maximum texts per encode call
+            max_wait_ms: How long to wait for more requests after the first one
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding, returns a Future resolving to its vector"""
+        future = Future()
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str):
+        """Submit a text and block until its embedding is ready"""
+        return self.submit(text).result()
+
+    def _collect_batch(self) -> list:
+        """Block for the first request, then gather more until full or timed out"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            # Encode each distinct text once
+            positions = {}
+            for i, (text, _) in enumerate(batch):
+                positions.setdefault(text, []).append(i)
+            texts = list(positions)
+
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for text, embedding in zip(texts, embeddings):
+                for i in positions[text]:
+                    batch[i][1].set_result(embedding.copy())
+
+            self.batches += 1
+            self.requests += len(batch)
+
+    def close(self):
+        """Stop the worker after it has drained the queued requests"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            worker = self._worker
+
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+    def stats(self) -> dict:
+        """Get batch counters"""
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'pending': self._queue.qsize(),
+        }
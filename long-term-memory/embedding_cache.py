@@ -0,0 +1,228 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
+
+
+def text_hash(text: str) -> str:
+    """Content hash used as the embedding cache key"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Bounded in-process LRU cache of embeddings keyed by content hash"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> np.ndarray:
+        """
+        Look up an embedding and mark it as most recently used
+
+        Returns a copy of the cached vector, or None on a miss
+        """
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding.copy()
+
+    def put(self, key: str, embedding: np.ndarray):
+        """Insert an embedding, evicting the least recently used entries if full"""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+
+            self._entries[key] = np.array(embedding, copy=True)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Get cache size and hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PersistentEmbeddingStore:
+    """
+    Append-only on-disk embedding store that survives restarts
+
+    Vectors are appended as raw float32 rows to `<prefix>.f32` and read back
+    through a memory map; `<prefix>.idx` maps text hashes to row numbers.
+    The prefix is derived from (model name, dimension), so changing the
+    embedding model starts a fresh store instead of serving stale vectors.
+    """
+
+    def __init__(self, directory: str, model_name: str, dim: int):
+        os.makedirs(directory, exist_ok=True)
+
+        prefix = hashlib.sha256(f"{model_name}:{dim}".encode("utf-8")).hexdigest()[:16]
+        self.vectors_path = os.path.join(directory, f"{prefix}.f32")
+        self.index_path = os.path.join(directory, f"{prefix}.idx")
+        self.model_name = model_name
+        self.dim = dim
+
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+        self._index = {}
+        self._index_offset = 0
+        self._mmap = None
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        if not os.path.exists(self.index_path):
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(f"# model={model_name} dim={dim}\n")
+
+        self._refresh_index()
+
+    def _vector_rows(self) -> int:
+        """Number of complete rows in the vectors file"""
+        try:
+            return os.path.getsize(self.vectors_path) // self._row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def _refresh_index(self):
+        """Read index lines appended since the last refresh (also by other processes)"""
+        try:
+            if os.path.getsize(self.index_path) <= self._index_offset:
+                return
+        except FileNotFoundError:
+            return
+
+        rows_on_disk = self._vector_rows()
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+
+        # Only consume complete lines; a partial trailing line is re-read later
+        end = data.rfind(b"\n") + 1
+        self._index_offset += end
+
+        for line in data[:end].decode("utf-8").splitlines():
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(" ")
+            if len(parts) != 2 or not parts[1].isdigit():
+                continue
+            row = int(parts[1])
+            if row < rows_on_disk:
+                self._index[parts[0]] = row
+
+    def _remap(self):
+        """Re-open the memory map so it covers rows appended since the last map"""
+        rows = self._vector_rows()
+        if rows == 0:
+            self._mmap = None
+        else:
+            self._mmap = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+        self._mapped_rows = rows
+
+    def get(self, key: str) -> np.ndarray:
+        """Look up an embedding by text hash, returns None on a miss"""
+        with self._lock:
+            row = self._index.get(key)
+            if row is None:
+                self._refresh_index()
+                row = self._index.get(key)
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            if row >= self._mapped_rows:
+                self._remap()
+
+            self.hits += 1
+            return np.array(self._mmap[row])
+
+    def put(self, key: str, embedding: np.ndarray):
+        """Append an embedding to the store (no-op if the key is already stored)"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(self.dim)
+
+        with self._lock:
+            if key in self._index:
+                return
+
+            with open(self.vectors_path, "ab") as vectors, \
+                    open(self.index_path, "a", encoding="utf-8") as index:
+                if fcntl:
+                    fcntl.flock(vectors.fileno(), fcntl.LOCK_EX)
+                try:
+                    # Drop a torn row left behind by a crashed writer
+                    size = os.fstat(vectors.fileno()).st_size
+                    row = size // self._row_bytes
+                    if size % self._row_bytes:
+                        vectors.truncate(row * self._row_bytes)
+
+                    # Vector first, index line second: an index entry never
+                    # points at a row that is not fully on disk
+                    vectors.write(vector.tobytes())
+                    vectors.flush()
+                    index.write(f"{key} {row}\n")
+                    index.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(vectors.fileno(), fcntl.LOCK_UN)
+
+            self._index[key] = row
+            self.writes += 1
+
+    def stats(self) -> dict:
+        """Get store size and hit/miss/write counters"""
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'path': self.vectors_path,
+            }
+
+    def __len__(self):
+        return len(self._index)
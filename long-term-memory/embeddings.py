@@ -1,14 +1,167 @@
-from sentence_transformers import SentenceTransformer
+import threading
 import numpy as np
 import config
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache, PersistentEmbeddingStore, text_hash
 
 class EmbeddingManager:
-    """Manages embedding generation using sentence-transformers"""
+    """Manages embedding generation using sentence-transformers (or its ONNX export)"""
     
     def __init__(self):
-        print(f"📦 Loading embedding model: {config.EMBEDDING_MODEL}...")
-        self.model = SentenceTransformer(config.EMBEDDING_MODEL)
-        print(f"✅ Embedding model loaded! Dimension: {config.EMBEDDING_DIM}")
+        # The model is loaded lazily (on first use or by start_warmup) so that
+        # importing this module does not block on torch / model loading
+        self._model = None
+        self._model_id = None  # set with the model, see model_id
+        self._model_lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warmup_done = threading.Event()
+        self._warmup_thread = None
+        
+        self.cache = EmbeddingCache(max_size=config.EMBEDDING_CACHE_SIZE)
+        
+        # Opened once the model is loaded, since it is keyed by the backend
+        # that actually loaded (see model_id)
+        self._store = None
+        
+        self.batcher = None
+        if config.EMBEDDING_BATCHING:
+            self.batcher = EmbeddingBatcher(
+                encode_fn=self._encode_texts,
+                max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=config.EMBEDDING_BATCH_MAX_WAIT_MS
+            )
+    
+    # ==================
+    # Model Loading
+    # ==================
+    
+    @property
+    def model_id(self) -> str:
+        """
+        Model name plus the loaded backend variant, so cached vectors never
+        mix backends (an ONNX setup that fell back to PyTorch reports the
+        plain model name). Loads the model if needed.
+        """
+        if self._model is None:
+            self._load_model()
+        return self._model_id
+    
+    @property
+    def store(self) -> PersistentEmbeddingStore:
+        """On-disk embedding store for the loaded model (None when disabled)"""
+        if config.EMBEDDING_STORE_DIR and self._model is None:
+            self._load_model()
+        return self._store
+    
+    @property
+    def model(self):
+        """The SentenceTransformer model, loaded on first access"""
+        if self._model is None:
+            self._load_model()
+        return self._model
+    
+    def _load_model(self):
+        with self._model_lock:
+            if self._model is not None:
+                return
+            
+            model = None
+            if config.EMBEDDING_BACKEND == "onnx":
+                try:
+                    from onnx_embeddings import load_onnx_model
+                    
+                    print(f"📦 Loading ONNX embedding model: {config.EMBEDDING_MODEL}...")
+                    model = load_onnx_model()
+                    model_id = f"{config.EMBEDDING_MODEL}@onnx{'-int8' if config.EMBEDDING_ONNX_QUANTIZE else ''}"
+                    print(f"✅ ONNX embedding model loaded! Dimension: {config.EMBEDDING_DIM}")
+                except Exception as e:
+                    print(f"⚠️  ONNX backend unavailable ({e}), falling back to PyTorch")
+            
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                
+                print(f"📦 Loading embedding model: {config.EMBEDDING_MODEL}...")
+                model = SentenceTransformer(config.EMBEDDING_MODEL)
+                model_id = config.EMBEDDING_MODEL
+                print(f"✅ Embedding model loaded! Dimension: {config.EMBEDDING_DIM}")
+            
+            if config.EMBEDDING_STORE_DIR:
+                self._store = PersistentEmbeddingStore(
+                    directory=config.EMBEDDING_STORE_DIR,
+                    model_name=model_id,
+                    dim=config.EMBEDDING_DIM
+                )
+                print(f"💽 Embedding store: {len(self._store)} cached embeddings on disk")
+            
+            # Published last: other threads only skip the lock once the
+            # model id and store match the model
+            self._model_id = model_id
+            self._model = model
+    
+    def _warmup(self):
+        try:
+            self._load_model()
+            # Dummy encode so the first real request doesn't pay for
+            # lazy initialisation and buffer allocation
+            self._model.encode("warmup", convert_to_numpy=True)
+            self._ready.set()
+        except Exception as e:
+            print(f"⚠️  Embedding warm-up failed: {e}")
+        finally:
+            self._warmup_done.set()
+    
+    def start_warmup(self):
+        """Load and warm up the model in a background thread (idempotent)"""
+        with self._warmup_lock:
+            if self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(
+                target=self._warmup, name="embedding-warmup", daemon=True
+            )
+        self._warmup_thread.start()
+    
+    def is_ready(self) -> bool:
+        """True once the model is loaded and warmed up"""
+        return self._ready.is_set()
+    
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """
+        Block until the model is warmed up (starts the warm-up if needed)
+        
+        Returns True if the model is ready, False on timeout or warm-up failure
+        """
+        self.start_warmup()
+        self._warmup_done.wait(timeout)
+        return self.is_ready()
+    
+    # ==================
+    # Embedding
+    # ==================
+    
+    def _encode_texts(self, texts: list) -> np.ndarray:
+        """Run the model on a list of texts (no caching)"""
+        return self.model.encode(texts, convert_to_numpy=True)
+    
+    def _lookup(self, key: str) -> np.ndarray:
+        """Look up an embedding in memory first, then on disk"""
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            return embedding
+        
+        if self.store is not None:
+            embedding = self.store.get(key)
+            if embedding is not None:
+                self.cache.put(key, embedding)
+                return embedding
+        
+        return None
+    
+    def _remember(self, key: str, embedding: np.ndarray):
+        """Write a freshly computed embedding through to all cache tiers"""
+        self.cache.put(key, embedding)
+        if self.store is not None:
+            self.store.put(key, embedding)
     
     def generate_embedding(self, text: str) -> np.ndarray:
         """
@@ -20,7 +173,18 @@ class EmbeddingManager:
         Returns:
             numpy array of shape (384,)
         """
-        embedding = self.model.encode(text, convert_to_numpy=True)
+        key = text_hash(text)
+        
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        
+        if self.batcher:
+            # Coalesced with concurrent callers into one batched forward pass
+            embedding = self.batcher.encode(text)
+        else:
+            embedding = self.model.encode(text, convert_to_numpy=True)
+        self._remember(key, embedding)
         return embedding
     
     def generate_embeddings_batch(self, texts: list) -> np.ndarray:
@@ -33,9 +197,43 @@ class EmbeddingManager:
         Returns:
             numpy array of shape (n, 384)
         """
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        keys = [text_hash(text) for text in texts]
+        embeddings = np.zeros((len(texts), config.EMBEDDING_DIM), dtype=np.float32)
+        
+        # Only encode texts that are not cached (each distinct text once)
+        missing = {}
+        for i, key in enumerate(keys):
+            cached = self._lookup(key)
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+        
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = [texts[missing[key][0]] for key in missing_keys]
+            encoded = self._encode_texts(missing_texts)
+            
+            for key, embedding in zip(missing_keys, encoded):
+                self._remember(key, embedding)
+                embeddings[missing[key]] = embedding
+        
         return embeddings
     
+    def get_cache_stats(self) -> dict:
+        """Get embedding cache hit/miss/eviction counters (and disk store counters)"""
+        stats = self.cache.stats()
+        if self._store is not None:
+            stats['store'] = self._store.stats()
+        if self.batcher:
+            stats['batcher'] = self.batcher.stats()
+        return stats
+    
+    def close(self):
+        """Stop background workers (drains pending batched requests)"""
+        if self.batcher:
+            self.batcher.close()
+    
     def compute_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
         Compute cosine similarity between two embeddings
@@ -58,6 +256,145 @@ class EmbeddingManager:
         similarity = (similarity + 1) / 2
         
         return float(similarity)
+    
+    # ==================
+    # Batched Similarity
+    # ==================
+    # These work on raw cosine similarity (-1 to 1), the same scale as the
+    # `similarity` returned by DatabaseManager.search_ltm
+    
+    @staticmethod
+    def normalize(embeddings: np.ndarray) -> np.ndarray:
+        """
+        L2-normalize a vector or the rows of a matrix
+        
+        Returns:
+            float32 array of the same shape with unit-length rows
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        return embeddings / np.clip(norms, 1e-12, None)
+    
+    def top_k_similar(self, query: np.ndarray, matrix: np.ndarray, k: int = 5,
+                      normalized: bool = False) -> tuple:
+        """
+        Find the k rows of a matrix most similar to a query vector
+        
+        Args:
+            query: Query vector of shape (dim,)
+            matrix: Candidate matrix of shape (n, dim)
+            k: Number of results
+            normalized: Set if query and matrix rows are already unit length
+            
+        Returns:
+            (indices, scores) arrays sorted by descending cosine similarity
+        """
+        if not normalized:
+            query = self.normalize(query)
+            matrix = self.normalize(matrix)
+        
+        scores = matrix @ query
+        return self._top_k(scores, k)
+    
+    def similarity_matrix(self, a: np.ndarray, b: np.ndarray = None,
+                          normalized: bool = False, chunk_size: int = None) -> np.ndarray:
+        """
+        Cosine similarity between every row of a and every row of b
+        
+        Args:
+            a: Matrix of shape (n, dim)
+            b: Matrix of shape (m, dim), defaults to a
+            normalized: Set if rows are already unit length
+            chunk_size: Rows of a per matmul (bounds temporary memory)
+            
+        Returns:
+            (n, m) similarity matrix
+        """
+        a, b = self._prepare_pair(a, b, normalized)
+        chunk_size = chunk_size or config.SIMILARITY_CHUNK_SIZE
+        
+        result = np.empty((a.shape[0], b.shape[0]), dtype=np.float32)
+        for start in range(0, a.shape[0], chunk_size):
+            result[start:start + chunk_size] = a[start:start + chunk_size] @ b.T
+        return result
+    
+    def top_k_matrix(self, a: np.ndarray, b: np.ndarray = None, k: int = 5,
+                     normalized: bool = False, chunk_size: int = None,
+                     exclude_self: bool = False) -> tuple:
+        """
+        For every row of a, the k most similar rows of b
+        
+        Only one (chunk_size, m) block of scores is held at a time, so memory
+        stays bounded for large memory sets.
+        
+        Args:
+            exclude_self: Ignore the diagonal (use when b is a)
+            
+        Returns:
+            (indices, scores) arrays of shape (n, k), sorted per row
+        """
+        a, b = self._prepare_pair(a, b, normalized)
+        chunk_size = chunk_size or config.SIMILARITY_CHUNK_SIZE
+        k = min(k, b.shape[0])
+        
+        indices = np.empty((a.shape[0], k), dtype=np.int64)
+        scores = np.empty((a.shape[0], k), dtype=np.float32)
+        if k == 0:
+            return indices, scores
+        
+        for start in range(0, a.shape[0], chunk_size):
+            block = a[start:start + chunk_size] @ b.T
+            if exclude_self:
+                rows = np.arange(block.shape[0])
+                block[rows, rows + start] = -np.inf
+            
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            
+            indices[start:start + chunk_size] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + chunk_size] = np.take_along_axis(top_scores, order, axis=1)
+        
+        return indices, scores
+    
+    def similar_pairs(self, matrix: np.ndarray, threshold: float,
+                      normalized: bool = False, chunk_size: int = None) -> list:
+        """
+        All pairs (i, j, score) with i < j and cosine similarity >= threshold
+        
+        Used for deduplication and clustering without a Python O(n²) loop.
+        """
+        matrix = matrix if normalized else self.normalize(matrix)
+        chunk_size = chunk_size or config.SIMILARITY_CHUNK_SIZE
+        
+        pairs = []
+        for start in range(0, matrix.shape[0], chunk_size):
+            block = matrix[start:start + chunk_size] @ matrix.T
+            rows, cols = np.nonzero(block >= threshold)
+            rows = rows + start
+            upper = rows < cols
+            for i, j in zip(rows[upper], cols[upper]):
+                pairs.append((int(i), int(j), float(block[i - start, j])))
+        
+        return pairs
+    
+    def _prepare_pair(self, a: np.ndarray, b: np.ndarray, normalized: bool) -> tuple:
+        if not normalized:
+            a = self.normalize(a)
+            b = a if b is None else self.normalize(b)
+        elif b is None:
+            b = a
+        return a, b
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> tuple:
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
 
 # Global instance
 embedding_manager = EmbeddingManager()
@@ -0,0 +1,199 @@
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import config
+
+_engines = {}
+_async_engines = {}
+_lock = threading.Lock()
+
+
+class PoolMetrics:
+    """Checkout wait-time counters for one connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
+class _TimedPoolMixin:
+    """Records how long callers wait for a connection"""
+
+    @property
+    def metrics(self) -> PoolMetrics:
+        # Also covers pools rebuilt by Pool.recreate()
+        if not hasattr(self, "_metrics"):
+            self._metrics = PoolMetrics()
+        return self._metrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_budget(is_async: bool) -> tuple:
+    """
+    Split the per-process connection budget between the sync and async pools
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW cap the whole process; the async pool gets
+    DB_ASYNC_POOL_SIZE of the persistent connections (and the same share of
+    overflow), the sync pool the rest. Each pool needs at least one
+    connection, so a process that uses the async engine needs
+    DB_POOL_SIZE >= 2.
+
+    Returns:
+        (pool_size, max_overflow)
+    """
+    if is_async and not 1 <= config.DB_ASYNC_POOL_SIZE < config.DB_POOL_SIZE:
+        raise ValueError(
+            f"DB_ASYNC_POOL_SIZE ({config.DB_ASYNC_POOL_SIZE}) must be at least 1 and "
+            f"leave the sync pool one of DB_POOL_SIZE ({config.DB_POOL_SIZE}) connections"
+        )
+
+    async_size = max(min(config.DB_ASYNC_POOL_SIZE, config.DB_POOL_SIZE - 1), 1)
+    async_overflow = config.DB_MAX_OVERFLOW * async_size // max(config.DB_POOL_SIZE, 1)
+    if is_async:
+        return async_size, async_overflow
+    return max(config.DB_POOL_SIZE - async_size, 1), max(config.DB_MAX_OVERFLOW - async_overflow, 0)
+
+
+def get_engine(url: str = None):
+    """
+    Process-wide shared engine for a database URL
+
+    Every DatabaseManager in a process gets the same engine (and so the same
+    tuned connection pool) instead of building its own.
+    """
+    url = url or config.DATABASE_URL
+
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            pool_size, max_overflow = _pool_budget(is_async=False)
+            engine = create_engine(
+                url,
+                poolclass=TimedQueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=config.DB_POOL_TIMEOUT,
+                pool_recycle=config.DB_POOL_RECYCLE,
+                pool_pre_ping=config.DB_POOL_PRE_PING,
+            )
+            _engines[url] = engine
+        return engine
+
+
+def get_async_engine(url: str = None):
+    """
+    Process-wide shared async engine (asyncpg) for a database URL
+
+    Shares the connection budget with get_engine (see _pool_budget), so
+    running both pipelines doesn't double the connections per process.
+    """
+    # Imported here so sync-only tools (migrate, consolidation) don't need greenlet
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = url or config.ASYNC_DATABASE_URL
+
+    with _lock:
+        engine = _async_engines.get(url)
+        if engine is None:
+            pool_size, max_overflow = _pool_budget(is_async=True)
+            engine = create_async_engine(
+                url,
+                poolclass=TimedAsyncAdaptedQueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=config.DB_POOL_TIMEOUT,
+                pool_recycle=config.DB_POOL_RECYCLE,
+                pool_pre_ping=config.DB_POOL_PRE_PING,
+            )
+
+            @event.listens_for(engine.sync_engine, "connect")
+            def _register_vector(dbapi_connection, connection_record):
+                # Teach asyncpg the pgvector type
+                from pgvector.asyncpg import register_vector
+                dbapi_connection.run_async(register_vector)
+
+            _async_engines[url] = engine
+        return engine
+
+
+def _pool_stats(pool) -> dict:
+    metrics = pool.metrics
+    max_overflow = max(pool._max_overflow, 0)
+    capacity = pool.size() + max_overflow
+    checked_out = pool.checkedout()
+
+    return {
+        'pool_size': pool.size(),
+        'max_overflow': max_overflow,
+        'checked_out': checked_out,
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'utilization': checked_out / capacity if capacity else 0.0,
+        'checkouts': metrics.checkouts,
+        'timeouts': metrics.timeouts,
+        'avg_wait_ms': metrics.total_wait / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+        'max_wait_ms': metrics.max_wait * 1000,
+    }
+
+
+def get_pool_stats() -> dict:
+    """
+    Connection pool utilization and checkout wait metrics
+
+    Returns:
+        dict of "sync" / "async" (for the engines created so far), each with
+        pool size, checked-out connections, utilization (0-1) and average /
+        max checkout wait in milliseconds
+    """
+    with _lock:
+        pools = {}
+        for engine in _engines.values():
+            pools.setdefault('sync', engine.pool)
+        for engine in _async_engines.values():
+            pools.setdefault('async', engine.sync_engine.pool)
+
+    return {kind: _pool_stats(pool) for kind, pool in pools.items()}
+
+
+def dispose_engines():
+    """Close all pooled connections (e.g. after fork or at shutdown)"""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+        # Async connections can only be closed on their event loop (see
+        # AsyncDatabaseManager.close); here the pool just drops them
+        for engine in _async_engines.values():
+            engine.sync_engine.dispose(close=False)
+        _async_engines.clear()
@@ -0,0 +1,157 @@
+import re
+import threading
+import numpy as np
+import config
+from embeddings import embedding_manager
+
+# Messages that never carry anything worth remembering
+SMALL_TALK = {
+    "hi", "hello", "hey", "yo", "thanks", "thank you", "thx", "ty", "ok", "okay",
+    "k", "cool", "nice", "great", "awesome", "sure", "yes", "no", "yep", "nope",
+    "lol", "haha", "bye", "goodbye", "see you", "good morning", "good night",
+    "got it", "sounds good", "makes sense", "all good", "np", "no problem",
+}
+
+# First-person statements are the usual source of personal memories
+FIRST_PERSON = re.compile(
+    r"\b(i|i'm|im|i've|i'd|i'll|my|mine|me|myself|we|our|us)\b", re.IGNORECASE
+)
+
+# Prototype "memorable" statements, one per kind of memory we extract
+MEMORABLE_PROTOTYPES = [
+    "My name is Alex and I am 29 years old.",
+    "I live in Berlin and work as a software engineer.",
+    "I really love Italian food but I hate mushrooms.",
+    "My favorite programming language is Python.",
+    "I'm allergic to peanuts.",
+    "I have two kids and a dog named Max.",
+    "I'm planning to move to Canada next year.",
+    "My goal is to run a marathon this year.",
+    "I decided to quit my job and start my own company.",
+    "I prefer short answers without too much detail.",
+    "I'm studying for my machine learning exam next month.",
+    "My wife's birthday is on March 3rd.",
+]
+
+
+class ExtractionFilter:
+    """
+    Cheap local gate in front of the extraction LLM call
+
+    Exchanges are skipped when the user message is small talk (a known
+    phrase, or a short message without any first-person statement) or when
+    its embedding is not close to any prototype memorable statement. The
+    user message embedding is usually already cached from LTM retrieval.
+
+    Short replies ("Sarah", "Berlin", "yes") carry facts through the
+    assistant's turns: an answer to an assistant question, or a short message
+    whose paired reply is known, is scored on the whole exchange instead of
+    being dropped by the heuristic.
+
+    In shadow mode every exchange still goes to the LLM; the filter only
+    records what it would have skipped, so misses can be measured.
+    """
+
+    def __init__(self, min_similarity: float = config.PREFILTER_MIN_SIMILARITY,
+                 min_words: int = config.PREFILTER_MIN_WORDS,
+                 shadow: bool = config.PREFILTER_SHADOW_MODE):
+        """
+        Args:
+            min_similarity: Min cosine similarity to the nearest prototype
+            min_words: Shorter messages need a first-person statement to pass
+            shadow: Record decisions without skipping anything
+        """
+        self.min_similarity = min_similarity
+        self.min_words = min_words
+        self.shadow = shadow
+
+        self._prototypes = None
+        self._lock = threading.Lock()
+
+        self.checked = 0
+        self.skipped = 0
+        self.skipped_heuristic = 0
+        self.skipped_similarity = 0
+        self.shadow_misses = 0  # would have skipped, but the LLM found a memory
+
+    @property
+    def prototypes(self) -> np.ndarray:
+        """Normalized prototype embeddings (computed on first use)"""
+        if self._prototypes is None:
+            embeddings = embedding_manager.generate_embeddings_batch(MEMORABLE_PROTOTYPES)
+            self._prototypes = embedding_manager.normalize(embeddings)
+        return self._prototypes
+
+    def is_promising(self, user_message: str, assistant_response: str = None,
+                     previous_response: str = None) -> bool:
+        """
+        Decide whether an exchange is worth an extraction LLM call
+
+        Args:
+            user_message: User's message
+            assistant_response: Assistant's reply to it
+            previous_response: Assistant turn the user was replying to
+
+        Returns True if the exchange should reach the LLM (callers in shadow
+        mode send it anyway and report back via record_shadow_outcome)
+        """
+        reason = self._skip_reason(user_message, assistant_response, previous_response)
+
+        with self._lock:
+            self.checked += 1
+            if reason == 'heuristic':
+                self.skipped_heuristic += 1
+            elif reason == 'similarity':
+                self.skipped_similarity += 1
+            if reason:
+                self.skipped += 1
+
+        return reason is None
+
+    def _skip_reason(self, user_message: str, assistant_response: str = None,
+                     previous_response: str = None) -> str:
+        text = user_message.strip().lower().rstrip("!.?")
+        if not text:
+            return 'heuristic'
+
+        answers_question = bool(previous_response) and "?" in previous_response
+        if text in SMALL_TALK and not answers_question:
+            return 'heuristic'
+
+        scored = user_message
+        if text in SMALL_TALK or (len(text.split()) < self.min_words
+                                  and not FIRST_PERSON.search(text)):
+            if not answers_question and not assistant_response:
+                return 'heuristic'
+            # Too short to judge alone: score it with the surrounding turns
+            scored = "\n".join(
+                turn for turn in (previous_response if answers_question else None,
+                                  user_message, assistant_response)
+                if turn
+            )
+
+        query = embedding_manager.normalize(embedding_manager.generate_embedding(scored))
+        if float(np.max(self.prototypes @ query)) < self.min_similarity:
+            return 'similarity'
+
+        return None
+
+    def record_shadow_outcome(self, promising: bool, remembered: bool):
+        """Count exchanges the filter would have skipped but that produced a memory"""
+        if not promising and remembered:
+            with self._lock:
+                self.shadow_misses += 1
+
+    def stats(self) -> dict:
+        """Get skip rate and shadow-mode miss counters"""
+        with self._lock:
+            return {
+                'shadow': self.shadow,
+                'checked': self.checked,
+                'skipped': self.skipped,
+                'skipped_heuristic': self.skipped_heuristic,
+                'skipped_similarity': self.skipped_similarity,
+                'skip_rate': self.skipped / self.checked if self.checked else 0.0,
+                'shadow_misses': self.shadow_misses,
+                'shadow_miss_rate': self.shadow_misses / self.skipped if self.skipped else 0.0,
+            }
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+
+
+class ExtractionWorker:
+    """
+    Background worker pool for memory extraction
+
+    Keeps the extraction LLM call, embedding and insert off the response
+    path: jobs go into a bounded queue and are processed by worker threads
+    with retries and exponential backoff. close() drains the queue.
+    """
+
+    def __init__(self, handler, num_workers: int = 2, max_queue: int = 100,
+                 max_retries: int = 3, retry_backoff: float = 1.0):
+        """
+        Args:
+            handler: Callable run for each job (exceptions trigger a retry;
+                     retries get the same argument objects, so a handler can
+                     keep progress in a mutable argument and resume)
+            num_workers: Worker threads
+            max_queue: Max queued jobs; submit() rejects jobs beyond this
+            max_retries: Retries per job after the first failure
+            retry_backoff: Base delay in seconds, doubled on each retry
+        """
+        self.handler = handler
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stop = threading.Event()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self._total_lag = 0.0
+        self._max_lag = 0.0
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"extraction-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, *args, **kwargs) -> bool:
+        """
+        Queue a job for background processing
+
+        Returns False if the worker is closed or the queue is full
+        """
+        if self._closed:
+            return False
+
+        try:
+            self._queue.put_nowait((time.monotonic(), args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print("⚠️  Extraction queue full, dropping job")
+            return False
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+
+            enqueued_at, args, kwargs = job
+            try:
+                self._process(args, kwargs)
+            finally:
+                lag = time.monotonic() - enqueued_at
+                with self._lock:
+                    self._total_lag += lag
+                    self._max_lag = max(self._max_lag, lag)
+                self._queue.task_done()
+
+    def _process(self, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handler(*args, **kwargs)
+                with self._lock:
+                    self.completed += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"⚠️  Memory extraction failed after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self.failed += 1
+                    return
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def close(self, timeout: float = None) -> bool:
+        """
+        Stop accepting jobs and wait for the queue to drain
+
+        Returns True if every queued job finished within the timeout
+        """
+        self._closed = True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+
+        drained = self._queue.unfinished_tasks == 0
+        self._stop.set()
+        if drained:
+            for worker in self._workers:
+                worker.join()
+        return drained
+
+    def stats(self) -> dict:
+        """Get queue depth, lag (seconds) and job counters"""
+        with self._queue.mutex:
+            oldest = self._queue.queue[0][0] if self._queue.queue else None
+
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                'queue_depth': self._queue.qsize(),
+                'oldest_pending_age': time.monotonic() - oldest if oldest else 0.0,
+                'in_flight': self._queue.unfinished_tasks - self._queue.qsize(),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'retries': self.retries,
+                'dropped': self.dropped,
+                'avg_lag': self._total_lag / finished if finished else 0.0,
+                'max_lag': self._max_lag,
+            }
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+
+
+class _UserIndex:
+    """
+    One user's memories as a normalized matrix plus row metadata
+
+    Treated as immutable: updates build a new instance, so a concurrent
+    search always sees rows and matrix that match.
+    """
+
+    def __init__(self, rows: list, matrix: np.ndarray, loaded_at: float):
+        self.rows = rows
+        self.matrix = matrix
+        self.loaded_at = loaded_at
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, config.EMBEDDING_DIM)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-12, None)
+
+
+class UserMemoryIndexCache:
+    """
+    Per-user in-process vector index in front of DatabaseManager.search_ltm
+
+    Each active user's memories are held as a contiguous normalized matrix,
+    so top-k is a single matmul instead of a database round trip. Entries
+    are kept up to date by store_ltm / delete_ltm in this process, and
+    expire after `ttl_seconds` to pick up writes from other processes.
+    """
+
+    def __init__(self, max_users: int, ttl_seconds: float, max_memories_per_user: int):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_memories_per_user = max_memories_per_user
+
+        self._users = OrderedDict()
+        self._memory_owner = {}  # memory id -> user id (for delete_ltm)
+        self._oversized = {}     # user id -> time we found too many memories to cache
+        self._write_version = 0  # bumped on every write, guards loads racing with writes
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ==================
+    # Search
+    # ==================
+
+    def search(self, user_id: str, query_embedding: np.ndarray, top_k: int,
+               min_similarity: float, loader, rank_by_relevance: bool = False) -> list:
+        """
+        Top-k memories for a user, loading the user's index on a miss
+
+        Args:
+            loader: Callable(user_id, limit) returning (rows, embeddings) from
+                    the database, where rows are search_ltm-style dicts
+            rank_by_relevance: Rank by weighted similarity + importance (and
+                               set relevance_score), like search_ltm_by_relevance
+
+        Returns:
+            List of memory dicts (same shape as search_ltm), or None if the
+            user has too many memories to cache (caller should query the DB)
+        """
+        if self._is_oversized(user_id):
+            return None
+
+        index = self._get(user_id)
+
+        if index is None:
+            version = self._write_version
+            rows, embeddings = loader(user_id, self.max_memories_per_user + 1)
+            if len(rows) > self.max_memories_per_user:
+                with self._lock:
+                    self._oversized[user_id] = time.monotonic()
+                return None
+            index = self._put(user_id, rows, embeddings, version)
+
+        if not index.rows:
+            return []
+
+        query = _normalize(query_embedding)[0]
+        scores = index.matrix @ query
+
+        ranking = scores
+        if rank_by_relevance:
+            importance = np.array([row['importance'] for row in index.rows], dtype=np.float32)
+            ranking = (
+                scores * config.SIMILARITY_WEIGHT
+                + importance / 10.0 * config.IMPORTANCE_WEIGHT
+            )
+            ranking = np.where(scores >= min_similarity, ranking, -np.inf)
+
+        k = min(top_k, len(index.rows))
+        top = np.argpartition(-ranking, k - 1)[:k]
+        top = top[np.argsort(-ranking[top])]
+
+        results = []
+        for i in top:
+            similarity = float(scores[i])
+            if similarity < min_similarity:
+                continue
+            memory = dict(index.rows[i])
+            memory['similarity'] = similarity
+            if rank_by_relevance:
+                memory['relevance_score'] = float(ranking[i])
+            results.append(memory)
+        return results
+
+    def _is_oversized(self, user_id: str) -> bool:
+        with self._lock:
+            found_at = self._oversized.get(user_id)
+            if found_at is None:
+                return False
+            if time.monotonic() - found_at > self.ttl_seconds:
+                del self._oversized[user_id]
+                return False
+            return True
+
+    def _get(self, user_id: str) -> _UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and time.monotonic() - index.loaded_at > self.ttl_seconds:
+                self._drop(user_id)
+                index = None
+
+            if index is None:
+                self.misses += 1
+                return None
+
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return index
+
+    def _put(self, user_id: str, rows: list, embeddings: np.ndarray,
+             version: int) -> _UserIndex:
+        index = _UserIndex(rows, _normalize(embeddings), time.monotonic())
+        with self._lock:
+            if version != self._write_version:
+                # A write landed while loading; use this snapshot once, don't cache it
+                return index
+
+            self._drop(user_id)
+            self._users[user_id] = index
+            for row in rows:
+                self._memory_owner[row['id']] = user_id
+
+            while len(self._users) > self.max_users:
+                oldest = next(iter(self._users))
+                self._drop(oldest)
+                self.evictions += 1
+        return index
+
+    def _drop(self, user_id: str):
+        index = self._users.pop(user_id, None)
+        if index is not None:
+            for row in index.rows:
+                self._memory_owner.pop(row['id'], None)
+
+    # ==================
+    # Write-through Updates
+    # ==================
+
+    def add_memory(self, user_id: str, row: dict, embedding: np.ndarray):
+        """Append a newly stored memory to the user's index (if cached)"""
+        with self._lock:
+            self._write_version += 1
+            index = self._users.get(user_id)
+            if index is None:
+                return
+            if len(index.rows) >= self.max_memories_per_user:
+                self._drop(user_id)
+                return
+
+            self._users[user_id] = _UserIndex(
+                index.rows + [row],
+                np.vstack([index.matrix, _normalize(embedding)]),
+                index.loaded_at,
+            )
+            self._memory_owner[row['id']] = user_id
+
+    def remove_memory(self, memory_id: int):
+        """Remove a deleted memory from whichever cached index holds it"""
+        with self._lock:
+            self._write_version += 1
+            user_id = self._memory_owner.pop(memory_id, None)
+            index = self._users.get(user_id) if user_id is not None else None
+            if index is None:
+                return
+
+            keep = [i for i, row in enumerate(index.rows) if row['id'] != memory_id]
+            self._users[user_id] = _UserIndex(
+                [index.rows[i] for i in keep],
+                index.matrix[keep],
+                index.loaded_at,
+            )
+
+    def update_memory(self, memory_id: int, **fields):
+        """Update metadata (e.g. importance) of a cached memory in place"""
+        with self._lock:
+            self._write_version += 1
+            user_id = self._memory_owner.get(memory_id)
+            index = self._users.get(user_id) if user_id is not None else None
+            if index is None:
+                return
+
+            rows = [
+                dict(row, **fields) if row['id'] == memory_id else row
+                for row in index.rows
+            ]
+            self._users[user_id] = _UserIndex(rows, index.matrix, index.loaded_at)
+
+    def invalidate_user(self, user_id: str):
+        """Drop a user's cached index (reloaded on next search)"""
+        with self._lock:
+            self._write_version += 1
+            self._drop(user_id)
+            self._oversized.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._write_version += 1
+            self._users.clear()
+            self._memory_owner.clear()
+            self._oversized.clear()
+
+    def stats(self) -> dict:
+        """Get cached user count and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'memories': len(self._memory_owner),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Global instance (None when disabled)
+ltm_index_cache = (
+    UserMemoryIndexCache(
+        max_users=config.LTM_CACHE_MAX_USERS,
+        ttl_seconds=config.LTM_CACHE_TTL_SECONDS,
+        max_memories_per_user=config.LTM_CACHE_MAX_MEMORIES_PER_USER,
+    )
+    if config.LTM_CACHE_ENABLED
+    else None
+)
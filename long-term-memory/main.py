@@ -3,11 +3,16 @@ from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
+from datetime import datetime
+import asyncio
 import uuid
 import config
 from database import DatabaseManager
 from memory_manager import MemoryManager
 from context_builder import ContextBuilder
+from embeddings import embedding_manager
+from engine_registry import get_pool_stats
+from stm_buffer import stm_buffer
 
 # ======================
 # State Definition
@@ -16,12 +21,17 @@ class State(TypedDict):
     messages: Annotated[list, add_messages]
     user_id: str
     session_id: str
+    turn_started_at: datetime
+    relevant_memories: list
+    stm_messages: list
+    context: list
 
 # ======================
 # Initialize Components
 # ======================
 db = DatabaseManager()
 memory_manager = MemoryManager()
+async_db = memory_manager.async_db
 context_builder = ContextBuilder()
 
 llm = ChatOpenAI(
@@ -34,35 +44,43 @@ llm = ChatOpenAI(
 # ======================
 # Graph Nodes
 # ======================
+# Full LTM pipeline:
+#
+#              ┌→ store_user_message ─┐
+#   begin_turn ┼→ retrieve_ltm ───────┼→ build_context → generate → extract_memory
+#              └→ load_stm ───────────┘
+#
+# The three retrieval-phase branches are independent and run concurrently,
+# so that phase costs as much as its slowest branch instead of the sum.
 
-def chat_node(state: State):
-    """
-    Main chat node with full LTM pipeline:
-    LTM → Search → STM → Context Window → LLM
-    """
-    user_id = state["user_id"]
-    session_id = state["session_id"]
-    messages = state["messages"]
-    
-    # Get current user message
-    user_message = messages[-1]
-    
-    # Store in STM
-    db.add_stm_message(user_id, session_id, "user", user_message.content)
+def begin_turn(state: State):
+    """Mark the start of the turn (load_stm reads history from before it)"""
+    user_message = state["messages"][-1]
     
     print(f"\n{'='*60}")
     print(f"💬 User: {user_message.content}")
     print(f"{'='*60}\n")
     
-    # ==================
-    # STEP 1: LTM - Search & Retrieve
-    # ==================
-    print("🔍 Searching long-term memories...")
-    relevant_memories = memory_manager.retrieve_relevant_memories(
-        user_id=user_id,
+    return {"turn_started_at": datetime.utcnow()}
+
+async def store_user_message(state: State):
+    """Store the current user message in STM"""
+    user_message = state["messages"][-1]
+    await async_db.add_stm_message(
+        state["user_id"], state["session_id"], "user", user_message.content
+    )
+    return {}
+
+async def retrieve_ltm(state: State):
+    """STEP 1: LTM - embed the query and search long-term memories"""
+    user_message = state["messages"][-1]
+    
+    relevant_memories = await memory_manager.aretrieve_relevant_memories(
+        user_id=state["user_id"],
         query=user_message.content
     )
     
+    print("🔍 Searched long-term memories")
     if relevant_memories:
         print(f"   ✅ Found {len(relevant_memories)} relevant memories:")
         for i, mem in enumerate(relevant_memories, 1):
@@ -71,52 +89,84 @@ def chat_node(state: State):
     else:
         print("   No relevant memories found")
     
-    # ==================
-    # STEP 2: STM - Get Recent Messages
-    # ==================
-    print(f"\n📝 Loading recent conversation (last {config.STM_LIMIT} messages)...")
-    stm_messages = db.get_stm_messages(session_id, limit=config.STM_LIMIT)
-    print(f"   ✅ Loaded {len(stm_messages)} messages from STM")
+    return {"relevant_memories": relevant_memories}
+
+async def load_stm(state: State):
+    """STEP 2: STM - load the conversation history preceding this turn"""
+    # Runs concurrently with store_user_message, so read only messages from
+    # before this turn; the current message is appended in build_context
+    stm_messages = await async_db.get_stm_messages(
+        state["session_id"],
+        limit=config.STM_LIMIT - 1,
+        before=state["turn_started_at"]
+    )
+    print(f"📝 Loaded {len(stm_messages)} earlier messages from STM (limit {config.STM_LIMIT})")
     
-    # ==================
-    # STEP 3: Context Window Assembly
-    # ==================
+    return {"stm_messages": stm_messages}
+
+def build_context(state: State):
+    """STEP 3: Context window assembly (joins the retrieval branches)"""
     print("\n🔧 Assembling context window...")
-    context = context_builder.build_context(
-        ltm_memories=relevant_memories,
-        stm_messages=stm_messages
-    )
+    if config.CONTEXT_TOKEN_BUDGET:
+        context, report = context_builder.build_budgeted_context(
+            ltm_memories=state["relevant_memories"],
+            stm_messages=state["stm_messages"],
+            current_message=state["messages"][-1].content,
+            session_id=state["session_id"]
+        )
+        if report['dropped_memory_ids'] or report['stm_dropped']:
+            print(f"   ✂️  Over budget ({report['budget']} tokens): dropped "
+                  f"{len(report['dropped_memory_ids'])} memories {report['dropped_memory_ids']}, "
+                  f"{report['stm_dropped']} oldest STM messages")
+    else:
+        context = context_builder.build_context(
+            ltm_memories=state["relevant_memories"],
+            stm_messages=state["stm_messages"],
+            session_id=state["session_id"]
+        )
+        context.append(HumanMessage(content=state["messages"][-1].content))
     
     # Get context stats
     stats = context_builder.get_context_stats(context)
-    print(f"   Context: {stats['total_messages']} messages, ~{stats['estimated_tokens']} tokens")
+    print(f"   Context: {stats['total_messages']} messages, {stats['estimated_tokens']} tokens")
     print(f"   Breakdown: {stats['system_messages']} system, {stats['user_messages']} user, {stats['assistant_messages']} assistant")
+    prefix = context_builder.measure_prefix_stability(state["session_id"], context)
+    print(f"   Stable prefix: {prefix['stable_prefix_tokens']}/{prefix['total_tokens']} tokens "
+          f"({prefix['stable_ratio']:.0%}) unchanged since last turn")
     
-    # ==================
-    # STEP 4: LLM Response Generation
-    # ==================
+    return {"context": context}
+
+async def generate(state: State):
+    """STEP 4: LLM response generation"""
     print("\n🤖 Generating response...")
-    response = llm.invoke(context)
+    response = await llm.ainvoke(state["context"])
     
     # Store assistant response in STM
-    db.add_stm_message(user_id, session_id, "assistant", response.content)
-    
-    # ==================
-    # STEP 5: Memory Extraction (Post-Response)
-    # ==================
-    memory_created = memory_manager.create_memory(
-        user_id=user_id,
-        session_id=session_id,
-        user_message=user_message.content,
-        assistant_response=response.content
+    await async_db.add_stm_message(
+        state["user_id"], state["session_id"], "assistant", response.content
     )
     
-    if memory_created:
+    return {"messages": [response]}
+
+async def extract_memory(state: State):
+    """STEP 5: Memory extraction (post-response)"""
+    exchange = dict(
+        user_id=state["user_id"],
+        session_id=state["session_id"],
+        user_message=state["messages"][-2].content,
+        assistant_response=state["messages"][-1].content
+    )
+    
+    if config.BACKGROUND_EXTRACTION:
+        # Off the critical path: the answer is returned now, memory stored later
+        if memory_manager.enqueue_memory(**exchange):
+            print("   🧠 Memory extraction queued")
+    elif await memory_manager.acreate_memory(**exchange):
         print("   💾 New memory stored in LTM")
     
     print(f"\n{'='*60}\n")
     
-    return {"messages": [response]}
+    return {}
 
 # ======================
 # Build Graph
@@ -126,11 +176,22 @@ def create_graph():
     workflow = StateGraph(State)
     
     # Add nodes
-    workflow.add_node("chat", chat_node)
+    workflow.add_node("begin_turn", begin_turn)
+    workflow.add_node("store_user_message", store_user_message)
+    workflow.add_node("retrieve_ltm", retrieve_ltm)
+    workflow.add_node("load_stm", load_stm)
+    workflow.add_node("build_context", build_context)
+    workflow.add_node("generate", generate)
+    workflow.add_node("extract_memory", extract_memory)
     
-    # Add edges
-    workflow.add_edge(START, "chat")
-    workflow.add_edge("chat", END)
+    # Add edges: fan out after begin_turn, join before context assembly
+    workflow.add_edge(START, "begin_turn")
+    for branch in ("store_user_message", "retrieve_ltm", "load_stm"):
+        workflow.add_edge("begin_turn", branch)
+    workflow.add_edge(["store_user_message", "retrieve_ltm", "load_stm"], "build_context")
+    workflow.add_edge("build_context", "generate")
+    workflow.add_edge("generate", "extract_memory")
+    workflow.add_edge("extract_memory", END)
     
     return workflow.compile()
 
@@ -141,6 +202,13 @@ def run_chat():
     """Run interactive chat with long-term memory"""
     graph = create_graph()
     
+    # One event loop for the whole chat: pooled async connections are bound to it
+    loop = asyncio.new_event_loop()
+    
+    # Load the embedding model while the user is typing
+    if config.EMBEDDING_BACKGROUND_WARMUP:
+        embedding_manager.start_warmup()
+    
     # User identification (in real app, this would be from auth)
     user_id = input("Enter your user ID (or press Enter for 'user_1'): ").strip() or "user_1"
     session_id = str(uuid.uuid4())[:8]  # Short session ID
@@ -165,6 +233,10 @@ def run_chat():
             continue
         
         if user_input.lower() == 'quit':
+            embedding_manager.close()
+            memory_manager.close()
+            loop.run_until_complete(async_db.close())
+            loop.close()
             print("\n👋 Goodbye!")
             break
         
@@ -184,11 +256,11 @@ def run_chat():
             continue
         
         # Invoke the graph
-        result = graph.invoke({
+        result = loop.run_until_complete(graph.ainvoke({
             "messages": [HumanMessage(content=user_input)],
             "user_id": user_id,
             "session_id": session_id
-        })
+        }))
         
         # Print AI response
         ai_message = result["messages"][-1]
@@ -226,6 +298,41 @@ def show_stats(user_id: str, session_id: str):
     print(f"Short-term Messages (STM): {stm_count}")
     print(f"STM Limit: {config.STM_LIMIT}")
     print(f"LTM Retrieval: Top {config.TOP_K_MEMORIES}, Min Similarity: {config.MIN_SIMILARITY}")
+    cache_stats = embedding_manager.get_cache_stats()
+    print(f"Embedding Cache: {cache_stats['size']}/{cache_stats['max_size']} entries, "
+          f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['evictions']} evictions")
+    if 'store' in cache_stats:
+        store_stats = cache_stats['store']
+        print(f"Embedding Store: {store_stats['entries']} on disk, "
+              f"{store_stats['hits']} hits, {store_stats['misses']} misses")
+    context_stats = context_builder.get_cache_stats()
+    print(f"Context Memoization: memory blocks {context_stats['ltm_block_hits']} reused / "
+          f"{context_stats['ltm_block_misses']} built, STM messages {context_stats['stm_message_hits']} "
+          f"reused / {context_stats['stm_message_misses']} built")
+    if stm_buffer:
+        buffer_stats = stm_buffer.stats()
+        print(f"STM Buffer: {buffer_stats['sessions']} sessions, "
+              f"{buffer_stats['hits']} hits, {buffer_stats['misses']} misses")
+    write_stats = memory_manager.get_write_stats()
+    print(f"Memory Writes: {write_stats['inserted']} inserted, {write_stats['merged']} merged into duplicates")
+    if memory_manager.extractor.prefilter:
+        filter_stats = memory_manager.extractor.prefilter.stats()
+        mode = " (shadow)" if filter_stats['shadow'] else ""
+        print(f"Extraction Pre-filter{mode}: {filter_stats['skipped']}/{filter_stats['checked']} skipped "
+              f"({filter_stats['skip_rate']:.0%}), {filter_stats['shadow_misses']} shadow misses")
+    extraction_stats = memory_manager.extraction_worker.stats()
+    print(f"Extraction Queue: {extraction_stats['queue_depth']} queued, "
+          f"lag avg {extraction_stats['avg_lag']:.1f}s / max {extraction_stats['max_lag']:.1f}s, "
+          f"{extraction_stats['completed']} done, {extraction_stats['failed']} failed, "
+          f"{extraction_stats['dropped']} dropped")
+    access_stats = memory_manager.access_tracker.stats()
+    print(f"Access Tracking: {access_stats['pending']} pending, "
+          f"{access_stats['flushed_rows']} flushed in {access_stats['flushes']} batches")
+    for kind, pool_stats in get_pool_stats().items():
+        print(f"DB Pool ({kind}): {pool_stats['checked_out']}/{pool_stats['pool_size']}+{pool_stats['max_overflow']} in use "
+              f"({pool_stats['utilization']:.0%}), avg checkout wait {pool_stats['avg_wait_ms']:.1f}ms "
+              f"(max {pool_stats['max_wait_ms']:.1f}ms)")
     print(f"{'='*60}\n")
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
+from concurrent.futures import ThreadPoolExecutor
 import json
+import time
 import config
+from extraction_filter import ExtractionFilter
+from rate_limiter import TokenBucket
 
 class MemoryExtractor:
     """Extract important information worth remembering using LLM"""
@@ -14,6 +18,23 @@ class MemoryExtractor:
             temperature=0.3,  # Lower temperature for more consistent extraction
         )
         
+        # Shared by every caller (chat turns, background worker, batch_extract)
+        self.rate_limiter = TokenBucket(
+            rate=config.EXTRACTION_RATE_LIMIT_PER_SECOND,
+            capacity=config.EXTRACTION_RATE_LIMIT_BURST
+        )
+        
+        # Local small-talk gate in front of the LLM call (None when disabled)
+        self.prefilter = (
+            ExtractionFilter(
+                min_similarity=config.PREFILTER_MIN_SIMILARITY,
+                min_words=config.PREFILTER_MIN_WORDS,
+                shadow=config.PREFILTER_SHADOW_MODE
+            )
+            if config.PREFILTER_ENABLED
+            else None
+        )
+        
         self.extraction_prompt = """You are a memory extraction system. Analyze the conversation and determine if it contains information worth remembering long-term.
 
 Extract ONLY if the conversation contains:
@@ -43,20 +64,81 @@ Respond ONLY with valid JSON in this exact format:
 
 If nothing is worth remembering, respond with:
 {{"should_remember": false}}
+"""
+        
+        self.window_extraction_prompt = """You are a memory extraction system. Analyze the conversation exchanges below and extract every piece of information worth remembering long-term.
+
+Extract ONLY information such as:
+- Personal information (name, age, location, occupation, etc.)
+- User preferences or likes/dislikes
+- Important facts the user shared
+- Goals, plans, or decisions
+- Significant context that would be useful in future conversations
+
+DO NOT extract:
+- Generic greetings or small talk
+- Temporary/transient information
+- Questions without answers
+- Common knowledge or facts not specific to the user
+
+Combine facts that belong together into one memory, and do not repeat the same fact twice.
+
+Conversation:
+{conversation}
+
+Respond ONLY with valid JSON in this exact format:
+{{
+    "memories": [
+        {{
+            "memory_type": "personal_info/preference/fact/decision/goal",
+            "content": "concise memory description (one sentence)",
+            "importance": 1-10 (integer),
+            "exchange": number of the exchange it came from (integer)
+        }}
+    ]
+}}
+
+If nothing is worth remembering, respond with:
+{{"memories": []}}
 """
     
-    def extract_memory(self, user_message: str, assistant_response: str) -> dict:
+        self.consolidation_prompt = """You are a memory consolidation system. The memories below were stored about the same user and overlap with each other.
+
+Merge them into ONE memory that keeps every distinct fact. If memories contradict each other, keep the most specific one.
+
+Memories:
+{memories}
+
+Respond ONLY with valid JSON in this exact format:
+{{
+    "memory_type": "personal_info/preference/fact/decision/goal",
+    "content": "concise memory description (one or two sentences)",
+    "importance": 1-10 (integer)
+}}
+"""
+    
+    def extract_memory(self, user_message: str, assistant_response: str,
+                       raise_errors: bool = False) -> dict:
         """
         Extract memory from a conversation exchange
         
         Args:
             user_message: User's message
             assistant_response: Assistant's response
+            raise_errors: Re-raise LLM/parsing errors instead of returning None
+                          (lets callers retry)
             
         Returns:
             dict with extraction results or None if nothing to remember
         """
         try:
+            promising = (
+                self.prefilter.is_promising(user_message, assistant_response)
+                if self.prefilter else True
+            )
+            if not promising and not self.prefilter.shadow:
+                return None
+            
             # Format prompt
             prompt = self.extraction_prompt.format(
                 user_message=user_message,
@@ -64,23 +146,120 @@ If nothing is worth remembering, respond with:
             )
             
             # Get extraction from LLM
+            self.rate_limiter.acquire()
             response = self.llm.invoke([HumanMessage(content=prompt)])
             
             # Parse JSON response
             result = self._parse_json_response(response.content)
             
             # Validate extraction
+            memory = None
             if result and result.get('should_remember', False):
                 # Ensure all required fields
                 if all(k in result for k in ['memory_type', 'content', 'importance']):
                     # Clamp importance to 1-10
                     result['importance'] = max(1, min(10, result['importance']))
-                    return result
+                    memory = result
+            
+            if self.prefilter and self.prefilter.shadow:
+                self.prefilter.record_shadow_outcome(promising, memory is not None)
+            
+            return memory
             
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"⚠️  Memory extraction error: {e}")
             return None
+    
+    def extract_memories(self, exchanges: list, raise_errors: bool = False) -> list:
+        """
+        Extract memories from a window of exchanges in one LLM call
+        
+        Args:
+            exchanges: List of (user_msg, assistant_msg) tuples, oldest first
+            raise_errors: Re-raise LLM/parsing errors instead of returning []
+            
+        Returns:
+            List of memory dicts (memory_type, content, importance)
+        """
+        try:
+            promising = [True] * len(exchanges)
+            if self.prefilter:
+                promising = [
+                    self.prefilter.is_promising(
+                        user_msg, assistant_msg,
+                        previous_response=exchanges[i - 1][1] if i else None
+                    )
+                    for i, (user_msg, assistant_msg) in enumerate(exchanges)
+                ]
+                if not self.prefilter.shadow:
+                    exchanges = [e for e, keep in zip(exchanges, promising) if keep]
+                    if not exchanges:
+                        return []
+            
+            conversation = "\n\n".join(
+                f"Exchange {i}:\nUser: {user_msg}\nAssistant: {assistant_msg}"
+                for i, (user_msg, assistant_msg) in enumerate(exchanges, 1)
+            )
+            prompt = self.window_extraction_prompt.format(conversation=conversation)
+            
+            self.rate_limiter.acquire()
+            response = self.llm.invoke([HumanMessage(content=prompt)])
+            
+            result = self._parse_json_response(response.content) or {}
+            
+            memories = []
+            sources = set()
+            for memory in result.get('memories', []):
+                if all(k in memory for k in ['memory_type', 'content', 'importance']):
+                    memory['importance'] = max(1, min(10, memory['importance']))
+                    sources.add(memory.pop('exchange', None))
+                    memories.append(memory)
+            
+            if self.prefilter and self.prefilter.shadow:
+                # Unattributed memories count against every exchange
+                unattributed = any(not isinstance(n, int) for n in sources)
+                for i, keep in enumerate(promising, 1):
+                    self.prefilter.record_shadow_outcome(keep, i in sources or unattributed)
+            
+            return memories
             
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"⚠️  Memory extraction error: {e}")
+            return []
+    
+    def consolidate_memories(self, memories: list) -> dict:
+        """
+        Summarize a cluster of overlapping memories into a single memory
+        
+        Args:
+            memories: Memory dicts (memory_type, content, importance)
+            
+        Returns:
+            dict with memory_type, content and importance, or None on failure
+        """
+        try:
+            listing = "\n".join(
+                f"- [{m['memory_type']}] (importance {m['importance']}) {m['content']}"
+                for m in memories
+            )
+            prompt = self.consolidation_prompt.format(memories=listing)
+            
+            self.rate_limiter.acquire()
+            response = self.llm.invoke([HumanMessage(content=prompt)])
+            
+            result = self._parse_json_response(response.content)
+            if result and all(k in result for k in ['memory_type', 'content', 'importance']):
+                result['importance'] = max(1, min(10, result['importance']))
+                return result
+            
+            return None
+            
+        except Exception as e:
+            print(f"⚠️  Memory consolidation error: {e}")
             return None
     
     def _parse_json_response(self, response: str) -> dict:
@@ -105,20 +284,65 @@ If nothing is worth remembering, respond with:
         
         return None
     
-    def batch_extract(self, exchanges: list) -> list:
+    def batch_extract(self, exchanges: list, max_workers: int = None,
+                      max_retries: int = None) -> dict:
         """
-        Extract memories from multiple exchanges
+        Extract memories from multiple exchanges concurrently
+        
+        Exchanges run on a bounded thread pool; every LLM call takes a token
+        from the shared rate limiter, and failed calls are retried with
+        exponential backoff before the exchange is reported as failed.
         
         Args:
             exchanges: List of (user_msg, assistant_msg) tuples
+            max_workers: Concurrent LLM calls (default EXTRACTION_BATCH_CONCURRENCY)
+            max_retries: Retries per exchange (default EXTRACTION_MAX_RETRIES)
             
         Returns:
-            List of extracted memories
+            dict with:
+                results: one entry per exchange, in input order (memory dict,
+                         or None if nothing to remember / failed)
+                memories: extracted memories in input order
+                failures: list of (index, error message) for failed exchanges
         """
-        memories = []
-        for user_msg, assistant_msg in exchanges:
-            memory = self.extract_memory(user_msg, assistant_msg)
-            if memory:
+        max_workers = max_workers or config.EXTRACTION_BATCH_CONCURRENCY
+        if max_retries is None:
+            max_retries = config.EXTRACTION_MAX_RETRIES
+        
+        def run(exchange):
+            user_msg, assistant_msg = exchange
+            return self._extract_with_retry(user_msg, assistant_msg, max_retries)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # map() yields in input order regardless of completion order
+            outcomes = list(pool.map(run, exchanges))
+        
+        results, memories, failures = [], [], []
+        for i, (memory, error) in enumerate(outcomes):
+            results.append(memory)
+            if error is not None:
+                failures.append((i, error))
+            elif memory:
                 memories.append(memory)
         
-        return memories
+        if failures:
+            print(f"⚠️  Batch extraction: {len(failures)}/{len(exchanges)} exchanges failed")
+        
+        return {
+            'results': results,
+            'memories': memories,
+            'failures': failures
+        }
+    
+    def _extract_with_retry(self, user_message: str, assistant_response: str,
+                            max_retries: int) -> tuple:
+        """Rate-limited extract_memory with backoff, returns (memory, error message)"""
+        for attempt in range(max_retries + 1):
+            try:
+                return self.extract_memory(
+                    user_message, assistant_response, raise_errors=True
+                ), None
+            except Exception as e:
+                if attempt == max_retries:
+                    return None, str(e)
+                time.sleep(config.EXTRACTION_RETRY_BACKOFF_SECONDS * (2 ** attempt))
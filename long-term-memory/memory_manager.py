@@ -1,5 +1,11 @@
+import asyncio
+import threading
+from access_tracker import AccessTracker
+from async_database import AsyncDatabaseManager
 from database import DatabaseManager
 from embeddings import embedding_manager
+from extraction_worker import ExtractionWorker
+from ltm_cache import ltm_index_cache
 from memory_extractor import MemoryExtractor
 import config
 
@@ -8,8 +14,29 @@ class MemoryManager:
     
     def __init__(self):
         self.db = DatabaseManager()
+        self.async_db = AsyncDatabaseManager()
         self.extractor = MemoryExtractor()
         self.exchange_counter = {}  # Track exchanges per session
+        self.exchange_windows = {}  # session id -> (user id, buffered exchanges)
+        self._window_lock = threading.Lock()
+        self.memories_inserted = 0
+        self.memories_merged = 0
+        self._stats_lock = threading.Lock()
+        self._user_generations = {}  # user id -> bumped by clear_user_data (fences queued jobs)
+        self._user_locks = {}        # user id -> lock serializing the user's writes and clears
+        self._fence_lock = threading.Lock()  # guards the two dicts above (never held across DB I/O)
+        self.access_tracker = AccessTracker(
+            flush_fn=self.db.bulk_update_memory_access,
+            flush_interval=config.ACCESS_FLUSH_INTERVAL_SECONDS,
+            max_pending=config.ACCESS_FLUSH_MAX_PENDING
+        )
+        self.extraction_worker = ExtractionWorker(
+            handler=self._extract_and_store,
+            num_workers=config.EXTRACTION_WORKERS,
+            max_queue=config.EXTRACTION_QUEUE_SIZE,
+            max_retries=config.EXTRACTION_MAX_RETRIES,
+            retry_backoff=config.EXTRACTION_RETRY_BACKOFF_SECONDS
+        )
     
     # ==================
     # CREATE
@@ -29,6 +56,31 @@ class MemoryManager:
         
         return False
     
+    def _next_window(self, user_id: str, session_id: str, user_message: str,
+                     assistant_response: str) -> list:
+        """
+        Record an exchange and return the exchanges to extract from now
+        
+        With EXTRACTION_WINDOW_SIZE > 1 exchanges are buffered per session and
+        the whole window is returned once it is full; otherwise the exchange
+        itself is returned every EXTRACT_EVERY_N_EXCHANGES exchanges.
+        
+        Returns:
+            List of (user_msg, assistant_msg) tuples, or None to skip
+        """
+        if config.EXTRACTION_WINDOW_SIZE <= 1:
+            if not self.should_extract_now(session_id):
+                return None
+            return [(user_message, assistant_response)]
+        
+        with self._window_lock:
+            _, window = self.exchange_windows.setdefault(session_id, (user_id, []))
+            window.append((user_message, assistant_response))
+            if len(window) < config.EXTRACTION_WINDOW_SIZE:
+                return None
+            del self.exchange_windows[session_id]
+            return window
+    
     def create_memory(self, user_id: str, session_id: str, 
                      user_message: str, assistant_response: str) -> bool:
         """
@@ -37,34 +89,258 @@ class MemoryManager:
         Returns True if memory was created, False otherwise
         """
         # Check if we should extract now
-        if not self.should_extract_now(session_id):
+        exchanges = self._next_window(user_id, session_id, user_message, assistant_response)
+        if not exchanges:
             return False
         
-        print("🧠 Extracting memories...")
+        return self._extract_and_store(user_id, exchanges)
+    
+    def enqueue_memory(self, user_id: str, session_id: str,
+                       user_message: str, assistant_response: str) -> bool:
+        """
+        Queue memory extraction for an exchange on the background worker
         
-        # Extract memory using LLM
-        extraction = self.extractor.extract_memory(user_message, assistant_response)
+        Returns True if a job was queued, False if skipped or the queue is full
+        """
+        exchanges = self._next_window(user_id, session_id, user_message, assistant_response)
+        if not exchanges:
+            return False
+        
+        return self._submit(user_id, exchanges)
+    
+    def _extract(self, exchanges: list, raise_errors: bool = False) -> list:
+        """Extract memories from one exchange or a window (one LLM call either way)"""
+        if len(exchanges) == 1:
+            user_message, assistant_response = exchanges[0]
+            extraction = self.extractor.extract_memory(
+                user_message, assistant_response, raise_errors=raise_errors
+            )
+            return [extraction] if extraction else []
         
-        if not extraction:
+        return self.extractor.extract_memories(exchanges, raise_errors=raise_errors)
+    
+    def _extract_and_store(self, user_id: str, exchanges: list,
+                           raise_errors: bool = False, progress: dict = None,
+                           generation: int = None) -> bool:
+        """
+        Extract, embed and store memories (shared by sync and background paths)
+        
+        Args:
+            progress: Dict kept across worker retries; completed steps
+                      (extraction, embeddings, stored memories) are not redone
+            generation: User's data generation when the job was queued; the
+                        job is discarded if clear_user_data ran since
+        """
+        progress = {} if progress is None else progress
+        
+        if 'extractions' not in progress:
+            if self._is_fenced(user_id, generation):
+                return False
+            
+            print("🧠 Extracting memories...")
+            
+            # Extract memories using LLM
+            progress['extractions'] = self._extract(exchanges, raise_errors=raise_errors)
+        extractions = progress['extractions']
+        
+        if not extractions:
             print("   No significant memories found")
             return False
         
-        # Generate embedding for the memory
-        embedding = embedding_manager.generate_embedding(extraction['content'])
+        # Generate embeddings for all memories at once
+        if 'embeddings' not in progress:
+            progress['embeddings'] = embedding_manager.generate_embeddings_batch(
+                [extraction['content'] for extraction in extractions]
+            )
+        embeddings = progress['embeddings']
+        
+        # Store in LTM (or reinforce an existing near-duplicate), resuming
+        # after the last memory a previous attempt stored
+        progress.setdefault('stored', 0)
+        progress.setdefault('inserted', False)
+        while progress['stored'] < len(extractions):
+            extraction = extractions[progress['stored']]
+            embedding = embeddings[progress['stored']]
+            
+            # Checked and written under the user's lock, so clear_user_data
+            # can't interleave with this write (other users aren't blocked)
+            with self._user_lock(user_id):
+                if self._is_fenced(user_id, generation):
+                    print("   Discarded: user data was cleared")
+                    return False
+                inserted = self._store_memory(user_id, extraction, embedding)
+            
+            progress['inserted'] = progress['inserted'] or inserted
+            progress['stored'] += 1
         
-        # Store in LTM
-        memory_id = self.db.store_ltm(
+        if progress['inserted']:
+            self._enforce_capacity(user_id)
+        
+        return True
+    
+    def _store_memory(self, user_id: str, extraction: dict, embedding) -> bool:
+        """Insert one memory, or merge it into a near-duplicate; True if inserted"""
+        duplicate = self._find_duplicate(user_id, embedding)
+        if duplicate:
+            importance = self.db.merge_ltm(duplicate['id'], extraction['importance'])
+            if importance is not None:
+                self._print_merged(duplicate, importance)
+                return False
+        
+        self.db.store_ltm(
             user_id=user_id,
             content=extraction['content'],
             memory_type=extraction['memory_type'],
             importance=extraction['importance'],
             embedding=embedding
         )
+        self._print_created(extraction)
+        return True
+    
+    def _submit(self, user_id: str, exchanges: list) -> bool:
+        """Queue an extraction job, fenced against later clear_user_data"""
+        with self._fence_lock:
+            generation = self._user_generations.get(user_id, 0)
+        return self.extraction_worker.submit(
+            user_id, exchanges, raise_errors=True, progress={}, generation=generation
+        )
+    
+    def _is_fenced(self, user_id: str, generation: int) -> bool:
+        with self._fence_lock:
+            return generation is not None and generation != self._user_generations.get(user_id, 0)
+    
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._fence_lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+    
+    async def acreate_memory(self, user_id: str, session_id: str,
+                             user_message: str, assistant_response: str) -> bool:
+        """Async create_memory (LLM extraction and embedding in worker threads, async insert)"""
+        exchanges = self._next_window(user_id, session_id, user_message, assistant_response)
+        if not exchanges:
+            return False
+        
+        print("🧠 Extracting memories...")
+        
+        extractions = await asyncio.to_thread(self._extract, exchanges)
+        
+        if not extractions:
+            print("   No significant memories found")
+            return False
+        
+        embeddings = await asyncio.to_thread(
+            embedding_manager.generate_embeddings_batch,
+            [extraction['content'] for extraction in extractions]
+        )
+        
+        inserted = False
+        for extraction, embedding in zip(extractions, embeddings):
+            duplicate = await self._afind_duplicate(user_id, embedding)
+            if duplicate:
+                importance = await self.async_db.merge_ltm(duplicate['id'], extraction['importance'])
+                if importance is not None:
+                    self._print_merged(duplicate, importance)
+                    continue
+            
+            await self.async_db.store_ltm(
+                user_id=user_id,
+                content=extraction['content'],
+                memory_type=extraction['memory_type'],
+                importance=extraction['importance'],
+                embedding=embedding
+            )
+            self._print_created(extraction)
+            inserted = True
+        
+        if inserted:
+            await asyncio.to_thread(self._enforce_capacity, user_id)
+        
+        return True
+    
+    def _enforce_capacity(self, user_id: str):
+        """Evict the lowest-retention memories if inserts pushed the user over the cap"""
+        cap = config.LTM_MAX_MEMORIES_PER_USER
+        if not (config.LTM_EVICT_ON_INSERT and cap):
+            return
         
+        if self.db.count_ltm(user_id) > cap:
+            evicted = self.db.evict_ltm(user_id=user_id)
+            print(f"   🗑️  Evicted {evicted} low-retention memories (limit {cap})")
+    
+    def _find_duplicate(self, user_id: str, embedding) -> dict:
+        """Nearest existing memory above DEDUP_SIMILARITY_THRESHOLD, or None"""
+        if not config.DEDUP_ENABLED:
+            return None
+        
+        matches = self._search_duplicate_cache(user_id, embedding)
+        if matches is None:
+            matches = self.db.search_ltm(
+                user_id=user_id,
+                query_embedding=embedding,
+                top_k=1,
+                min_similarity=config.DEDUP_SIMILARITY_THRESHOLD
+            )
+        return matches[0] if matches else None
+    
+    async def _afind_duplicate(self, user_id: str, embedding) -> dict:
+        """Async _find_duplicate"""
+        if not config.DEDUP_ENABLED:
+            return None
+        
+        matches = None
+        if ltm_index_cache:
+            matches = await asyncio.to_thread(self._search_duplicate_cache, user_id, embedding)
+        if matches is None:
+            matches = await self.async_db.search_ltm(
+                user_id=user_id,
+                query_embedding=embedding,
+                top_k=1,
+                min_similarity=config.DEDUP_SIMILARITY_THRESHOLD
+            )
+        return matches[0] if matches else None
+    
+    def _search_duplicate_cache(self, user_id: str, embedding) -> list:
+        if not ltm_index_cache:
+            return None
+        
+        return ltm_index_cache.search(
+            user_id=user_id,
+            query_embedding=embedding,
+            top_k=1,
+            min_similarity=config.DEDUP_SIMILARITY_THRESHOLD,
+            loader=self.db.get_ltm_index_rows
+        )
+    
+    def _print_created(self, extraction: dict):
+        with self._stats_lock:
+            self.memories_inserted += 1
         print(f"   ✅ Memory created: [{extraction['memory_type']}] {extraction['content'][:50]}...")
         print(f"   Importance: {extraction['importance']}/10")
+    
+    def _print_merged(self, duplicate: dict, importance: int):
+        with self._stats_lock:
+            self.memories_merged += 1
+        print(f"   🔁 Merged into existing memory #{duplicate['id']}: {duplicate['content'][:50]}...")
+        print(f"   Importance: {importance}/10 (similarity {duplicate['similarity']:.2f})")
+    
+    def get_write_stats(self) -> dict:
+        """Get how many extracted memories were inserted vs merged into existing ones"""
+        with self._stats_lock:
+            return {
+                'inserted': self.memories_inserted,
+                'merged': self.memories_merged
+            }
+    
+    def flush_windows(self):
+        """Extract from partially filled exchange windows (e.g. at session end)"""
+        with self._window_lock:
+            windows, self.exchange_windows = self.exchange_windows, {}
         
-        return True
+        for user_id, exchanges in windows.values():
+            if config.BACKGROUND_EXTRACTION:
+                self._submit(user_id, exchanges)
+            else:
+                self._extract_and_store(user_id, exchanges)
     
     # ==================
     # SEARCH & RETRIEVE
@@ -79,27 +355,83 @@ class MemoryManager:
         # Generate query embedding
         query_embedding = embedding_manager.generate_embedding(query)
         
-        # Semantic search in LTM
-        memories = self.db.search_ltm(
+        # Semantic search: in-process index for active users, Postgres otherwise
+        memories = self._search_cache(user_id, query_embedding)
+        
+        if memories is None and config.LTM_SEARCH_MODE == "relevance":
+            # Thresholding and relevance ranking done in one SQL statement
+            memories = self.db.search_ltm_by_relevance(
+                user_id=user_id,
+                query_embedding=query_embedding,
+                top_k=config.TOP_K_MEMORIES,
+                min_similarity=config.MIN_SIMILARITY,
+                candidates=config.LTM_RELEVANCE_CANDIDATES
+            )
+        elif memories is None:
+            memories = self.db.search_ltm(
+                user_id=user_id,
+                query_embedding=query_embedding,
+                top_k=config.TOP_K_MEMORIES,
+                min_similarity=config.MIN_SIMILARITY
+            )
+        
+        return self._rank_and_track(memories)
+    
+    async def aretrieve_relevant_memories(self, user_id: str, query: str) -> list:
+        """Async retrieve_relevant_memories (embedding in a worker thread, async DB search)"""
+        query_embedding = await asyncio.to_thread(embedding_manager.generate_embedding, query)
+        
+        memories = None
+        if ltm_index_cache:
+            memories = await asyncio.to_thread(self._search_cache, user_id, query_embedding)
+        
+        if memories is None and config.LTM_SEARCH_MODE == "relevance":
+            memories = await self.async_db.search_ltm_by_relevance(
+                user_id=user_id,
+                query_embedding=query_embedding,
+                top_k=config.TOP_K_MEMORIES,
+                min_similarity=config.MIN_SIMILARITY,
+                candidates=config.LTM_RELEVANCE_CANDIDATES
+            )
+        elif memories is None:
+            memories = await self.async_db.search_ltm(
+                user_id=user_id,
+                query_embedding=query_embedding,
+                top_k=config.TOP_K_MEMORIES,
+                min_similarity=config.MIN_SIMILARITY
+            )
+        
+        return self._rank_and_track(memories)
+    
+    def _search_cache(self, user_id: str, query_embedding) -> list:
+        """Search the in-process index, None if disabled or the user isn't cacheable"""
+        if not ltm_index_cache:
+            return None
+        
+        return ltm_index_cache.search(
             user_id=user_id,
             query_embedding=query_embedding,
             top_k=config.TOP_K_MEMORIES,
-            min_similarity=config.MIN_SIMILARITY
+            min_similarity=config.MIN_SIMILARITY,
+            loader=self.db.get_ltm_index_rows,
+            rank_by_relevance=config.LTM_SEARCH_MODE == "relevance"
         )
-        
+    
+    def _rank_and_track(self, memories: list) -> list:
+        """Add relevance scores, record accesses and sort by relevance"""
         if not memories:
             return []
         
         # Calculate relevance scores (combine similarity + importance)
         for memory in memories:
-            relevance_score = self._calculate_relevance(
-                similarity=memory['similarity'],
-                importance=memory['importance']
-            )
-            memory['relevance_score'] = relevance_score
+            if 'relevance_score' not in memory:
+                memory['relevance_score'] = self._calculate_relevance(
+                    similarity=memory['similarity'],
+                    importance=memory['importance']
+                )
             
-            # Update access tracking
-            self.db.update_memory_access(memory['id'])
+            # Update access tracking (buffered, written in bulk off the response path)
+            self.access_tracker.record(memory['id'])
         
         # Sort by relevance score
         memories.sort(key=lambda x: x['relevance_score'], reverse=True)
@@ -127,14 +459,32 @@ class MemoryManager:
     
     def get_user_memories(self, user_id: str) -> list:
         """Get all memories for a user"""
+        self.access_tracker.flush()  # So access counts are current
         return self.db.get_all_ltm(user_id)
     
     def delete_memory(self, memory_id: int):
         """Delete a specific memory"""
         self.db.delete_ltm(memory_id)
     
+    def close(self):
+        """Drain pending memory extraction and flush buffered access tracking"""
+        self.flush_windows()
+        if not self.extraction_worker.close(timeout=config.EXTRACTION_DRAIN_TIMEOUT_SECONDS):
+            print("⚠️  Memory extraction queue not fully drained on shutdown")
+        self.access_tracker.close()
+    
     def clear_user_data(self, user_id: str):
-        """Clear all data for a user"""
-        self.db.clear_user_data(user_id)
-        if user_id in self.exchange_counter:
-            del self.exchange_counter[user_id]
+        """Clear all data for a user (queued extraction jobs for the user are discarded)"""
+        with self._user_lock(user_id):
+            with self._fence_lock:
+                self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+            self.db.clear_user_data(user_id)
+        
+        # Drop the user's buffered exchanges (keyed by session id)
+        with self._window_lock:
+            for session_id in [
+                session_id for session_id, (window_user_id, _) in self.exchange_windows.items()
+                if window_user_id == user_id
+            ]:
+                del self.exchange_windows[session_id]
+                self.exchange_counter.pop(session_id, None)
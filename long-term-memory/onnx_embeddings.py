@@ -0,0 +1,271 @@
+import json
+import os
+import numpy as np
+import config
+
+META_FILE = "embedding_meta.json"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+
+PARITY_TEXTS = [
+    "hi",
+    "what's my name?",
+    "My name is Sarah and I live in Berlin.",
+    "I prefer dark mode in all my editors.",
+    "I'm building a weather app with React and want to ship it next month.",
+]
+
+
+def _model_dir(model_name: str, base_dir: str) -> str:
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = True) -> dict:
+    """
+    Export a sentence-transformers model to ONNX (optionally int8-quantized)
+
+    Only the transformer is exported; mean pooling and normalization are
+    done in NumPy by OnnxEmbeddingModel. A parity check against the
+    PyTorch model is run and stored in the export metadata.
+
+    Args:
+        model_name: sentence-transformers model name
+        output_dir: Directory for the ONNX files, tokenizer and metadata
+        quantize: Also write a dynamically quantized int8 model
+
+    Returns:
+        The export metadata dict
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st_model[0], st_model[1]
+
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(
+            f"ONNX backend only supports mean pooling, {model_name} uses "
+            f"{pooling.get_pooling_mode_str()}"
+        )
+
+    normalize = any(type(module).__name__ == "Normalize" for module in st_model)
+    tokenizer = transformer.tokenizer
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+            ).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    dummy = tokenizer(["warmup"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    print(f"📦 Exporting {model_name} to ONNX...")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(transformer.auto_model.eval()),
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("   Quantizing to int8...")
+        quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+
+    meta = {
+        "model_name": model_name,
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": transformer.max_seq_length,
+        "normalize": normalize,
+        "input_names": input_names,
+        "quantized": quantize,
+    }
+    _write_meta(output_dir, meta)
+
+    # Parity against the PyTorch vectors for every exported variant
+    parity = {}
+    for variant_quantized in ([False, True] if quantize else [False]):
+        onnx_model = OnnxEmbeddingModel(output_dir, quantized=variant_quantized)
+        key = "int8" if variant_quantized else "fp32"
+        parity[key] = check_parity(onnx_model, st_model)
+        print(f"   Parity ({key}): min cosine {parity[key]['min_cosine']:.4f}")
+
+    meta["parity"] = parity
+    _write_meta(output_dir, meta)
+    print(f"✅ ONNX model exported to {output_dir}")
+
+    return meta
+
+
+def _write_meta(output_dir: str, meta: dict):
+    with open(os.path.join(output_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def _read_meta(model_dir: str) -> dict:
+    path = os.path.join(model_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_parity(onnx_model, torch_model, texts: list = None) -> dict:
+    """
+    Compare ONNX and PyTorch embeddings for the same texts
+
+    Returns:
+        dict with min/mean cosine similarity and max absolute difference
+    """
+    texts = texts or PARITY_TEXTS
+
+    expected = torch_model.encode(texts, convert_to_numpy=True)
+    actual = onnx_model.encode(texts, convert_to_numpy=True)
+
+    cosine = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+    }
+
+
+class OnnxEmbeddingModel:
+    """
+    CPU ONNX Runtime drop-in for SentenceTransformer.encode
+
+    Runs the exported transformer and applies mean pooling (+ L2
+    normalization if the source model has it) in NumPy, so no torch
+    import is needed at inference time.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.meta = _read_meta(model_dir)
+        if self.meta is None:
+            raise FileNotFoundError(f"No exported ONNX model in {model_dir}")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        model_file = INT8_FILE if quantized else FP32_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = self.meta["input_names"]
+        self.quantized = quantized
+
+    def encode(self, sentences, convert_to_numpy: bool = True, batch_size: int = 32) -> np.ndarray:
+        """
+        Embed a text or list of texts
+
+        Returns:
+            (dim,) array for a single string, (n, dim) array for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            batches.append(self._encode_batch(texts[start:start + batch_size]))
+
+        embeddings = (
+            np.concatenate(batches) if batches
+            else np.zeros((0, self.meta["dim"]), dtype=np.float32)
+        )
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feed = {name: feed[name] for name in self.input_names}
+
+        token_embeddings = self.session.run(None, feed)[0]
+
+        # Mean pooling over non-padding tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings = summed / counts
+
+        if self.meta["normalize"]:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        return embeddings.astype(np.float32)
+
+
+def load_onnx_model(model_name: str = None, base_dir: str = None,
+                    quantize: bool = None) -> OnnxEmbeddingModel:
+    """
+    Load the ONNX model for `model_name`, exporting it on first use
+
+    Raises ValueError if the exported model failed the parity check
+    (min cosine below config.EMBEDDING_ONNX_MIN_PARITY).
+    """
+    model_name = model_name or config.EMBEDDING_MODEL
+    base_dir = base_dir or config.EMBEDDING_ONNX_DIR
+    quantize = config.EMBEDDING_ONNX_QUANTIZE if quantize is None else quantize
+
+    model_dir = _model_dir(model_name, base_dir)
+    meta = _read_meta(model_dir)
+
+    if (meta is None or meta.get("model_name") != model_name
+            or "parity" not in meta or (quantize and not meta.get("quantized"))):
+        meta = export_onnx_model(model_name, model_dir, quantize=quantize)
+
+    parity = meta["parity"]["int8" if quantize else "fp32"]
+    if parity["min_cosine"] < config.EMBEDDING_ONNX_MIN_PARITY:
+        raise ValueError(
+            f"ONNX model failed parity check: min cosine {parity['min_cosine']:.4f} "
+            f"< {config.EMBEDDING_ONNX_MIN_PARITY}"
+        )
+
+    return OnnxEmbeddingModel(model_dir, quantized=quantize, num_threads=config.EMBEDDING_ONNX_THREADS)
+
+
+if __name__ == "__main__":
+    # Export (or re-export) the configured model and report parity
+    export_onnx_model(
+        config.EMBEDDING_MODEL,
+        _model_dir(config.EMBEDDING_MODEL, config.EMBEDDING_ONNX_DIR),
+        quantize=config.EMBEDDING_ONNX_QUANTIZE,
+    )
@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    acquire() blocks until a token is available, so bursts of up to
+    `capacity` calls go through immediately and the sustained rate is capped.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        Args:
+            rate: Tokens added per second (sustained calls per second)
+            capacity: Max tokens held (burst size)
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.waits = 0
+        self.total_wait = 0.0
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        self.waits += 1
+                        self.total_wait += waited
+                    return
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
@@ -38,3 +38,8 @@ DATABASE_URL = (
 # =========================
 STM_LIMIT = 10          # max raw messages kept
 SUMMARY_CHUNK = 5       # summarize first 5 messages
+
+# In-process STM ring buffer (write-through, saves the per-turn reads)
+STM_BUFFER_ENABLED = True
+STM_BUFFER_SIZE = STM_LIMIT + 2  # raw messages peak at STM_LIMIT + 2 before a chunk is summarized
+STM_BUFFER_MAX_SESSIONS = 1000   # LRU bound on buffered sessions
@@ -40,3 +40,6 @@ DATABASE_URL = (
 # Short-Term Memory Config
 # =========================
 MAX_MESSAGES = int(os.getenv("MAX_MESSAGES", 10))
+STM_BUFFER_ENABLED = True          # Keep each session's last MAX_MESSAGES in process (write-through)
+STM_BUFFER_SIZE = MAX_MESSAGES
+STM_BUFFER_MAX_SESSIONS = 1000     # LRU bound on buffered sessions
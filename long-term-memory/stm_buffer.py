@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict, deque
+import config
+
+
+class _SessionBuffer:
+    def __init__(self, capacity: int):
+        self.rows = deque(maxlen=capacity)
+        self.hydrated = False  # False: only holds rows written since the session was seen
+        self.complete = False  # True: rows are the session's entire history
+
+
+def _sort_key(row):
+    return (row.timestamp, row.id)
+
+
+class STMRingBuffer:
+    """
+    Write-through in-process buffer of each session's latest STM messages
+
+    Holds the last `capacity` rows per session, hydrated from the database
+    on the first read and kept current by add_stm_message, so steady-state
+    turns read STM without a query. Sessions are evicted LRU beyond
+    `max_sessions`. Assumes a session's messages are written through this
+    process (sessions are per-process in main.py).
+    """
+
+    def __init__(self, capacity: int, max_sessions: int):
+        self.capacity = capacity
+        self.max_sessions = max_sessions
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str, limit: int = None, before=None) -> list:
+        """
+        Latest messages of a session in chronological order
+
+        Returns:
+            List of rows, or None if the buffer can't answer (not hydrated,
+            or the request reaches past the buffered window)
+        """
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is None or not buffer.hydrated:
+                self.misses += 1
+                return None
+
+            rows = list(buffer.rows)
+            if before:
+                rows = [row for row in rows if row.timestamp < before]
+
+            if limit and len(rows) >= limit:
+                rows = rows[-limit:]
+            elif not buffer.complete:
+                self.misses += 1
+                return None
+
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return rows
+
+    def is_hydrated(self, session_id: str) -> bool:
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            return buffer is not None and buffer.hydrated
+
+    def hydrate(self, session_id: str, rows: list):
+        """
+        Fill a session's buffer from the database
+
+        Args:
+            rows: The session's latest `capacity` rows (any order). Rows
+                  written while they were loading are merged in.
+        """
+        with self._lock:
+            buffer = self._get_or_create(session_id)
+            merged = {row.id: row for row in rows}
+            for row in buffer.rows:
+                merged.setdefault(row.id, row)
+
+            buffer.rows = deque(sorted(merged.values(), key=_sort_key)[-self.capacity:],
+                                maxlen=self.capacity)
+            buffer.hydrated = True
+            buffer.complete = len(rows) < self.capacity and len(merged) <= self.capacity
+
+    def append(self, session_id: str, row):
+        """Write-through of a newly stored message"""
+        with self._lock:
+            buffer = self._get_or_create(session_id)
+            if any(existing.id == row.id for existing in buffer.rows):
+                return
+
+            if len(buffer.rows) == self.capacity:
+                buffer.complete = False  # the oldest row is about to drop out
+
+            if buffer.rows and _sort_key(row) < _sort_key(buffer.rows[-1]):
+                rows = sorted(list(buffer.rows) + [row], key=_sort_key)
+                buffer.rows = deque(rows[-self.capacity:], maxlen=self.capacity)
+            else:
+                buffer.rows.append(row)
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every buffered session of a user"""
+        with self._lock:
+            for session_id in [
+                session_id for session_id, buffer in self._sessions.items()
+                if any(row.user_id == user_id for row in buffer.rows)
+            ]:
+                del self._sessions[session_id]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def _get_or_create(self, session_id: str) -> _SessionBuffer:
+        buffer = self._sessions.get(session_id)
+        if buffer is None:
+            buffer = _SessionBuffer(self.capacity)
+            self._sessions[session_id] = buffer
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        self._sessions.move_to_end(session_id)
+        return buffer
+
+    def stats(self) -> dict:
+        """Get buffered session count and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Global instance (None when disabled)
+stm_buffer = (
+    STMRingBuffer(capacity=config.STM_LIMIT, max_sessions=config.STM_BUFFER_MAX_SESSIONS)
+    if config.STM_BUFFER_ENABLED
+    else None
+)
@@ -0,0 +1,59 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+pytest.importorskip("dotenv")
+
+import config
+import embeddings
+
+
+class FakeSentenceTransformer:
+    """Deterministic stand-in for the sentence-transformers model"""
+
+    encoded = 0
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def encode(self, texts, convert_to_numpy=True):
+        single = isinstance(texts, str)
+        batch = [texts] if single else texts
+        FakeSentenceTransformer.encoded += len(batch)
+        vectors = np.stack([
+            np.random.default_rng(sum(map(ord, text))).random(config.EMBEDDING_DIM, dtype=np.float32)
+            for text in batch
+        ])
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    monkeypatch.setattr(config, "EMBEDDING_BACKEND", "torch")
+    monkeypatch.setattr(config, "EMBEDDING_BATCHING", False)
+    monkeypatch.setattr(config, "EMBEDDING_STORE_DIR", str(tmp_path))
+    FakeSentenceTransformer.encoded = 0
+    return tmp_path
+
+
+def test_store_survives_restart(store_dir):
+    text = "My name is Sarah and I live in Berlin."
+
+    first = embeddings.EmbeddingManager()
+    expected = first.generate_embedding(text)
+    assert first.get_cache_stats()['store']['writes'] == 1
+    assert FakeSentenceTransformer.encoded == 1
+
+    # A fresh manager (warm restart) reads the vector back from disk
+    second = embeddings.EmbeddingManager()
+    np.testing.assert_allclose(second.generate_embedding(text), expected)
+    assert second.get_cache_stats()['store']['hits'] == 1
+    assert FakeSentenceTransformer.encoded == 1
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+import config
+
+
+class TokenCounter:
+    """
+    Local token counting for context budgeting
+
+    Uses tiktoken (installed with langchain-openai) with the configured
+    encoding; falls back to the chars/4 estimate if it is unavailable.
+    Counts are cached per text, since the system prompt, memories and
+    history messages repeat across turns.
+    """
+
+    def __init__(self, encoding_name: str, max_size: int = 4096,
+                 message_overhead: int = 4):
+        """
+        Args:
+            encoding_name: tiktoken encoding (e.g. "cl100k_base", "o200k_base")
+            max_size: Max cached counts (0 = no caching)
+            message_overhead: Tokens added per chat message (role/separators)
+        """
+        self.encoding_name = encoding_name
+        self.max_size = max_size
+        self.message_overhead = message_overhead
+
+        self._encoding = None
+        self._loaded = False
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def exact(self) -> bool:
+        """True if counts come from a real tokenizer (not the chars/4 estimate)"""
+        return self._get_encoding() is not None
+
+    def _get_encoding(self):
+        if not self._loaded:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                print(f"⚠️  Tokenizer unavailable ({e}), estimating tokens as chars/4")
+            self._loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        """Number of tokens in a text"""
+        with self._lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = len(text) // 4
+
+        if self.max_size > 0:
+            with self._lock:
+                self._cache[text] = tokens
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message) -> int:
+        """Tokens a chat message takes in the prompt (content + per-message overhead)"""
+        return self.count(message.content) + self.message_overhead
+
+    def count_messages(self, messages: list) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Global instance
+token_counter = TokenCounter(
+    encoding_name=config.TOKENIZER_ENCODING,
+    max_size=config.TOKEN_COUNT_CACHE_SIZE,
+    message_overhead=config.MESSAGE_TOKEN_OVERHEAD,
+)
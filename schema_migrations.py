@@ -0,0 +1,98 @@
+"""
+Versioned schema migrations shared by the memory apps
+
+Each app's database.py declares an append-only MIGRATIONS list of
+(version, description, function) for its component; applied versions are
+recorded per component in one schema_migrations table. The runtime path
+only checks the version (check_schema); DDL runs from the explicit
+migrate command:  python database.py migrate
+"""
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+_schema_checked = set()
+_schema_lock = threading.Lock()
+
+
+def get_schema_version(conn, component: str) -> int:
+    """Applied schema version for a component (0 if never migrated)"""
+    try:
+        with conn.begin_nested():
+            row = conn.execute(
+                text("SELECT version FROM schema_migrations WHERE component = :component"),
+                {"component": component},
+            ).first()
+    except ProgrammingError:
+        return 0  # schema_migrations table does not exist yet
+    return row.version if row else 0
+
+
+def migrate(engine, component: str, migrations: list, after=None) -> int:
+    """
+    Apply pending migrations, each in its own transaction
+
+    Args:
+        engine: Sync engine to migrate
+        component: Name the versions are recorded under
+        migrations: (version, description, function(conn)) tuples, in order
+        after: Optional function(conn) run in a final transaction on every
+               migrate (for config-driven DDL such as optional indexes)
+
+    Returns:
+        The schema version after migrating
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "component VARCHAR(100) PRIMARY KEY, "
+            "version INTEGER NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+
+    for version, description, apply in migrations:
+        with engine.begin() as conn:
+            # Serialize concurrent migrate runs
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:component))"),
+                         {"component": component})
+            if get_schema_version(conn, component) >= version:
+                continue
+
+            print(f"🛠️  Migration {version}: {description}")
+            apply(conn)
+            conn.execute(
+                text(
+                    "INSERT INTO schema_migrations (component, version, applied_at) "
+                    "VALUES (:component, :version, now()) "
+                    "ON CONFLICT (component) DO UPDATE "
+                    "SET version = EXCLUDED.version, applied_at = EXCLUDED.applied_at"
+                ),
+                {"component": component, "version": version},
+            )
+
+    with engine.begin() as conn:
+        if after:
+            after(conn)
+        version = get_schema_version(conn, component)
+
+    print(f"✅ Schema at version {version}")
+    return version
+
+
+def check_schema(engine, component: str, expected_version: int):
+    """Fail fast if the database has not been migrated (one query per engine per process)"""
+    key = (component, str(engine.url))
+    with _schema_lock:
+        if key in _schema_checked:
+            return
+
+        with engine.connect() as conn:
+            version = get_schema_version(conn, component)
+
+        if version < expected_version:
+            raise RuntimeError(
+                f"❌ Database schema is at version {version}, expected {expected_version}. "
+                f"Run: python database.py migrate"
+            )
+
+        _schema_checked.add(key)
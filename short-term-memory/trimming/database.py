@@ -1,8 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Sequence
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, MetaData, Table, Sequence, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import os
+import sys
 import config
+from stm_buffer import stm_buffer
+
+# The migration runner is shared with the long-term memory app (repo root)
+_root = os.path.dirname(os.path.abspath(__file__))
+while not os.path.exists(os.path.join(_root, "schema_migrations.py")) and os.path.dirname(_root) != _root:
+    _root = os.path.dirname(_root)
+sys.path.insert(0, _root)
+import schema_migrations
 
 Base = declarative_base()
 
@@ -15,10 +25,68 @@ class Message(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # get_messages / trim_messages: WHERE session_id = ? ORDER BY timestamp
+        Index('ix_messages_trimming_session_timestamp', 'session_id', 'timestamp'),
+    )
+
+
+# ======================
+# Schema Migrations
+# ======================
+# The runtime path only checks the schema version; DDL runs from the
+# explicit migrate command:  python database.py migrate
+SCHEMA_COMPONENT = "trimming"
+
+
+def _create_baseline(conn):
+    """Version 1 schema as originally shipped (pinned, so later models don't leak in)"""
+    metadata = MetaData()
+    Table(
+        "messages_trimming", metadata,
+        Column("id", Integer, Sequence("message_id_seq"), primary_key=True),
+        Column("session_id", String(100), nullable=False, index=True),
+        Column("role", String(20), nullable=False),
+        Column("content", Text, nullable=False),
+        Column("timestamp", DateTime),
+    )
+    metadata.create_all(conn)  # checkfirst: databases created before migrations keep their tables
+
+
+def _create_composite_indexes(conn):
+    for index in Message.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+# (version, description, function) - append only, never edit applied entries
+MIGRATIONS = [
+    (1, "messages_trimming table", _create_baseline),
+    (2, "composite (session_id, timestamp) index", _create_composite_indexes),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    """Applied schema version for this component (0 if never migrated)"""
+    return schema_migrations.get_schema_version(conn, SCHEMA_COMPONENT)
+
+
+def migrate(engine=None) -> int:
+    """Apply pending migrations, each in its own transaction"""
+    return schema_migrations.migrate(
+        engine or create_engine(config.DATABASE_URL), SCHEMA_COMPONENT, MIGRATIONS
+    )
+
+
+def check_schema(engine):
+    """Fail fast if the database has not been migrated"""
+    schema_migrations.check_schema(engine, SCHEMA_COMPONENT, SCHEMA_VERSION)
+
+
 class DatabaseManager:
     def __init__(self):
         self.engine = create_engine(config.DATABASE_URL)
-        Base.metadata.create_all(self.engine)
+        check_schema(self.engine)
         self.Session = sessionmaker(bind=self.engine)
     
     def add_message(self, session_id: str, role: str, content: str):
@@ -31,12 +99,25 @@ class DatabaseManager:
                 content=content
             )
             session.add(message)
+            session.flush()
+            session.expunge(message)  # Keep id/timestamp loaded past commit
             session.commit()
+            
+            if stm_buffer:
+                stm_buffer.append(session_id, message)
         finally:
             session.close()
     
     def get_messages(self, session_id: str, limit: int = None):
         """Get messages for a session, optionally limited to last N messages"""
+        if stm_buffer:
+            # Served from the in-process ring buffer when it covers the request
+            if not stm_buffer.is_hydrated(session_id):
+                stm_buffer.hydrate(session_id, self._load_recent(session_id, stm_buffer.capacity))
+            messages = stm_buffer.get(session_id, limit)
+            if messages is not None:
+                return messages
+        
         session = self.Session()
         try:
             query = session.query(Message).filter(
@@ -52,6 +133,16 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def _load_recent(self, session_id: str, limit: int):
+        """Last N messages of a session, newest first (ring buffer hydration)"""
+        session = self.Session()
+        try:
+            return session.query(Message).filter(
+                Message.session_id == session_id
+            ).order_by(Message.timestamp.desc()).limit(limit).all()
+        finally:
+            session.close()
+    
     def trim_messages(self, session_id: str, keep_last: int):
         """Keep only the last N messages, delete older ones"""
         session = self.Session()
@@ -71,6 +162,9 @@ class DatabaseManager:
                 ).delete(synchronize_session=False)
                 
                 session.commit()
+                
+                if stm_buffer:
+                    stm_buffer.remove(ids_to_delete)
                 return len(ids_to_delete)
             return 0
         finally:
@@ -84,5 +178,15 @@ class DatabaseManager:
                 Message.session_id == session_id
             ).delete()
             session.commit()
+            
+            if stm_buffer:
+                stm_buffer.invalidate(session_id)
         finally:
             session.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    else:
+        print("Usage: python database.py migrate")